@@ -0,0 +1,130 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# On-disk cache of Spotify API responses, shared by every user on this host.
+# Albums and artists are stored per id and reused for TTL seconds; whole
+# responses such as saved-track pages keep their ETag and are revalidated with
+# If-None-Match. Past MAX_BYTES the least recently used entries are evicted.
+PATH = os.getenv('SPOTIFY_CACHE_PATH', 'api_cache.db')
+TTL = float(os.getenv('SPOTIFY_CACHE_TTL', str(7 * 24 * 3600)))
+MAX_BYTES = int(os.getenv('SPOTIFY_CACHE_BYTES', str(256 * 1024 * 1024)))
+ENABLED = os.getenv('SPOTIFY_CACHE', '1') not in ('0', 'false')
+# Replay responses from the cache only and never call the API
+OFFLINE = os.getenv('SPOTIFY_OFFLINE', '0') not in ('0', 'false')
+
+_lock = threading.Lock()
+_conn = None
+_bytes = 0
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'not_modified': 0,
+    'stores': 0,
+    'evictions': 0,
+}
+
+
+def _connect():
+    global _conn, _bytes
+    if _conn is None:
+        _conn = sqlite3.connect(PATH, timeout=30, check_same_thread=False)
+        _conn.execute('PRAGMA journal_mode=WAL')
+        _conn.execute('PRAGMA synchronous=NORMAL')
+        _conn.execute('CREATE TABLE IF NOT EXISTS responses '
+                      '(key varchar PRIMARY KEY,etag varchar,body text,size integer,stored_at real,used_at real)')
+        _conn.execute('CREATE INDEX IF NOT EXISTS responses_used_at_idx ON responses (used_at)')
+        _bytes = _conn.execute('SELECT coalesce(sum(size),0) from responses').fetchone()[0]
+    return _conn
+
+def close():
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+        _conn = None
+
+def _evict(conn):
+    global _bytes
+    while _bytes > MAX_BYTES:
+        rows = conn.execute('SELECT key,size from responses order by used_at limit 100').fetchall()
+        if not rows:
+            break
+        conn.executemany('DELETE FROM responses where key = ?', [(key,) for key, size in rows])
+        _bytes -= sum(size for key, size in rows)
+        _stats['evictions'] += len(rows)
+
+#Stores (key, body, etag) triples in one transaction
+def put_many(entries):
+    global _bytes
+    now = time.time()
+    rows = []
+    for key, body, etag in entries:
+        text = json.dumps(body)
+        rows.append((key, etag, text, len(text), now, now))
+    if not rows:
+        return
+    with _lock:
+        conn = _connect()
+        old = dict(conn.execute('SELECT key,size from responses where key in ({})'.format(','.join('?' * len(rows))),
+                                [row[0] for row in rows]).fetchall())
+        conn.executemany('INSERT OR REPLACE INTO responses (key,etag,body,size,stored_at,used_at) VALUES (?,?,?,?,?,?)', rows)
+        _bytes += sum(row[3] for row in rows) - sum(old.values())
+        _stats['stores'] += len(rows)
+        _evict(conn)
+        conn.commit()
+
+def put(key, body, etag = None):
+    put_many([(key, body, etag)])
+
+#Returns {key: (body, etag, stored_at)} for the keys that are cached
+def get_many(keys):
+    keys = list(keys)
+    res = {}
+    if not keys:
+        return res
+    with _lock:
+        conn = _connect()
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i+500]
+            rows = conn.execute('SELECT key,body,etag,stored_at from responses where key in ({})'.format(
+                ','.join('?' * len(chunk))), chunk).fetchall()
+            for key, body, etag, stored_at in rows:
+                res[key] = (json.loads(body), etag, stored_at)
+        conn.executemany('UPDATE responses SET used_at = ? where key = ?', [(time.time(), key) for key in res])
+        conn.commit()
+    return res
+
+def get(key):
+    return get_many([key]).get(key)
+
+#Cached albums or artists younger than TTL (any age when offline), by id
+def get_entities(kind, ids):
+    if not ENABLED:
+        return {}
+    entries = get_many('{}:{}'.format(kind, i) for i in ids)
+    oldest = 0 if OFFLINE else time.time() - TTL
+    res = {}
+    for key, (body, etag, stored_at) in entries.items():
+        if stored_at >= oldest:
+            res[key.split(':', 1)[1]] = body
+    with _lock:
+        _stats['hits'] += len(res)
+        _stats['misses'] += len(ids) - len(res)
+    return res
+
+def put_entities(kind, objects):
+    if ENABLED:
+        put_many(('{}:{}'.format(kind, obj['id']), obj, None) for obj in objects if obj is not None)
+
+def record(name, count = 1):
+    with _lock:
+        _stats[name] += count
+
+def stats():
+    with _lock:
+        res = dict(_stats)
+        res['bytes'] = _bytes
+    return res
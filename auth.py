@@ -0,0 +1,22 @@
+import flask
+from dash import dcc, html
+
+# The user this browser logged in as, kept in Flask's signed session cookie
+# by the login page. Pages serve only that user's data: the username in their
+# URL and the user held in their callbacks' stores are both in the browser's
+# hands, so they are checked against the session.
+def login(username):
+    flask.session['user'] = username
+
+def current_user():
+    return flask.session.get('user')
+
+def authorized(user):
+    return user is not None and user == current_user()
+
+# Shown instead of a page whose user is not the one logged in
+def login_prompt():
+    return html.Div([
+        html.H1("Log in to see this page",style={'border-style':'solid','font-size':'7vmax','color':'white','text-align':'center'}),
+        dcc.Link("Log in",href='/',style={'color':'white','font-size':'2vmax'})
+    ],style={'padding':'25px'})
@@ -0,0 +1,62 @@
+#Times a first-time fetch of saved tracks, albums and artists against the fake
+#Spotify server at several concurrency settings, with the number of HTTP
+#connections the client opened. With --throttle-every, checks that every 429
+#paused all workers through the fetcher.
+#
+#    python -m bench.bench_fetch --tracks 5000 --latency 0.05 --workers 1 2 4 8
+import argparse
+import time
+
+import api_cache
+import fetcher
+import spotify
+from bench.fake_spotify import FakeSpotify
+from bench.synthetic import make_library
+
+
+def run(library,workers,latency,throttle_every):
+    server = FakeSpotify(library,latency=latency,throttle_every=throttle_every).start()
+    spotify.API_PREFIX = server.prefix
+    throttle = fetcher._throttle
+    pauses = []
+    fetcher._throttle = lambda delay: pauses.append(delay) or throttle(delay)
+    try:
+        start = time.perf_counter()
+        songs = spotify.get_liked_songs('fake-token',workers=workers)
+        album_ids = list(dict.fromkeys(song['track']['album']['id'] for song in songs))
+        artist_ids = list(dict.fromkeys(artist['id'] for song in songs for artist in song['track']['artists']))
+        albums = spotify.get_albums('fake-token',album_ids,workers=workers)
+        artists = spotify.get_artists('fake-token',artist_ids,workers=workers)
+        elapsed = time.perf_counter() - start
+    finally:
+        server.stop()
+        fetcher._throttle = throttle
+
+    assert [song['track']['id'] for song in songs] == [item['track']['id'] for item in library['saved_tracks']]
+    assert [album['id'] for album in albums] == album_ids
+    assert [artist['id'] for artist in artists] == artist_ids
+    # Every 429 has to reach the fetcher, which pauses all workers, rather
+    # than be retried by the HTTP layer in the thread that received it
+    assert len(pauses) == server.throttled,(len(pauses),server.throttled)
+    return elapsed,server.requests,server.throttled,server.connections
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks',type=int,default=5000)
+    parser.add_argument('--latency',type=float,default=0.05)
+    parser.add_argument('--throttle-every',type=int,default=0)
+    parser.add_argument('--workers',type=int,nargs='+',default=[1,2,4,8])
+    args = parser.parse_args()
+
+    fetcher.BACKOFF = 0.01
+    api_cache.ENABLED = False
+    library = make_library(args.tracks)
+    print('{:>8} {:>10} {:>9} {:>10} {:>12}'.format('workers','seconds','requests','throttled','connections'))
+    for workers in args.workers:
+        elapsed,requests,throttled,connections = run(library,workers,args.latency,args.throttle_every)
+        print('{:>8} {:>10.2f} {:>9} {:>10} {:>12}'.format(workers,elapsed,requests,throttled,connections))
+
+
+if __name__ == '__main__':
+    main()
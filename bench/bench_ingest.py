@@ -0,0 +1,78 @@
+#Compares the old execute_values INSERT path with the COPY + upsert loader on
+#processed track rows. Needs the local PostgreSQL that postgres.py uses;
+#it works on scratch copies of tracks and drops them afterwards.
+#
+#    python -m bench.bench_ingest --tracks 100000
+import argparse
+import time
+
+from psycopg2.extras import execute_values
+
+import postgres
+import spotify
+import storage
+from bench.synthetic import make_library
+
+TABLES = ('bench_execute_values','bench_copy')
+
+
+def _reset_tables():
+    with postgres.connection() as conn, conn.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute('DROP TABLE IF EXISTS {0}; CREATE TABLE {0} (LIKE tracks INCLUDING ALL)'.format(table))
+        conn.commit()
+
+def _drop_tables():
+    with postgres.connection() as conn, conn.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(table))
+        conn.commit()
+
+def execute_values_insert(records):
+    columns = list(records[0].keys())
+    query = 'INSERT INTO bench_execute_values ({}) VALUES %s'.format(','.join(columns))
+    values = [[value for value in record.values()] for record in records]
+    with postgres.connection() as conn, conn.cursor() as cursor:
+        execute_values(cursor,query,values)
+        conn.commit()
+
+def copy_upsert(records):
+    columns = list(records[0].keys())
+    postgres.bulk_upsert('bench_copy',columns,([record[column] for column in columns] for record in records),
+                         key=storage.KEYS['tracks'])
+
+def timed(func,records):
+    start = time.perf_counter()
+    func(records)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks',type=int,default=100000)
+    args = parser.parse_args()
+
+    library = make_library(args.tracks)
+    songs = spotify.track_columns(library['saved_tracks'])
+    records = [{'track_id': song_id,'track_name': song_name,'album_id': album,
+                'popularity': popularity,'preview_url': preview_url,'duration_ms': duration_ms}
+               for song_id,song_name,album,popularity,preview_url,duration_ms in zip(
+                   songs['song_id'],songs['song_name'],songs['album'],songs['popularity'],songs['preview_url'],songs['duration_ms'])]
+    postgres.create_tables()
+    _reset_tables()
+    try:
+        results = [
+            ('execute_values insert',timed(execute_values_insert,records)),
+            ('copy upsert (fresh)',timed(copy_upsert,records)),
+            ('copy upsert (all conflicts)',timed(copy_upsert,records)),
+        ]
+    finally:
+        _drop_tables()
+
+    print('{} rows from {} tracks'.format(len(records),args.tracks))
+    for name,seconds in results:
+        print('{:<30} {:>8.2f} s {:>12.0f} rows/s'.format(name,seconds,len(records)/seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#Peak Python heap of a first-time sync against the fake Spotify server: the
+#streaming sync.fetch_data next to the same stages run on whole-library lists.
+#Uses the embedded SQLite backend in a temporary directory.
+#
+#    python -m bench.bench_memory --tracks 10000 50000
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import api_cache
+import cache
+import fetcher
+import spotify
+import sqlite_store
+import storage
+import sync
+from bench.fake_spotify import FakeSpotify
+from bench.synthetic import make_library
+
+
+#The pre-streaming pipeline: every stage's full result is held at once
+def materialized(username):
+    token = spotify.spotify_init(username)
+    storage.create_tables()
+    songs = spotify.track_columns(spotify.get_liked_songs(token))
+    storage.add_liked_songs_dict(songs,'liked_songs',username)
+    artists = spotify.artist_columns(spotify.get_artists(token,list(set(a for artists in songs['artists'] for a in artists))))
+    storage.add_artists_dict(artists)
+    albums = spotify.album_columns(spotify.get_albums(token,list(set(songs['album']))))
+    storage.add_albums_dict(albums)
+
+def streaming(username):
+    sync.fetch_data(username,full_sync=True)
+
+def run(library,pipeline,directory):
+    sqlite_store.SQLITE_PATH = os.path.join(directory,'{}-{}.db'.format(pipeline.__name__,len(library['saved_tracks'])))
+    sqlite_store._local.conn = None
+    server = FakeSpotify(library).start()
+    spotify.API_PREFIX = server.prefix
+    try:
+        tracemalloc.start()
+        start = time.perf_counter()
+        pipeline('bench')
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        cache.clear()
+        assert storage.count_liked_songs('bench') == len(library['saved_tracks'])
+    finally:
+        tracemalloc.stop()
+        server.stop()
+        sqlite_store._local.conn.close()
+        sqlite_store._local.conn = None
+    return elapsed,peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks',type=int,nargs='+',default=[10000,50000])
+    args = parser.parse_args()
+
+    storage.BACKEND = 'sqlite'
+    spotify.spotify_init = lambda username: 'fake-token'
+    fetcher.BACKOFF = 0.01
+    api_cache.ENABLED = False
+    print('{:>8} {:>14} {:>10} {:>12}'.format('tracks','pipeline','seconds','peak MiB'))
+    with tempfile.TemporaryDirectory() as directory:
+        for tracks in args.tracks:
+            library = make_library(tracks,recent_plays=50)
+            for pipeline in (materialized,streaming):
+                elapsed,peak = run(library,pipeline,directory)
+                print('{:>8} {:>14} {:>10.2f} {:>12.1f}'.format(tracks,pipeline.__name__,elapsed,peak / 2**20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#Cold start of the Dash entry point. Each run starts a fresh interpreter that
+#imports index, serves the Dash index, layout and dependencies through the
+#Flask test client (bootstrap) and then renders the analytics page with its
+#years for one user (first_page), as a browser's first visit would. Runs with
+#and without SPOTIFY_PRELOAD and prints the median of each phase index
+#records, of those two steps and of the whole process.
+#
+#    python -m bench.bench_startup --repeat 5
+#
+#Uses an empty SQLite database in a temporary directory unless
+#SPOTIFY_STORAGE=postgres is set.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import sqlite_store
+import storage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json,time
+import index
+client = index.server.test_client()
+start = time.perf_counter()
+for path in ('/','/_dash-layout','/_dash-dependencies'):
+    client.get(path)
+index.STARTUP['bootstrap'] = time.perf_counter() - start
+start = time.perf_counter()
+import auth
+from pages import analytics
+with index.server.test_request_context():
+    auth.login('bench')
+    analytics.layout('bench')
+    analytics.year_options('bench')
+index.STARTUP['first_page'] = time.perf_counter() - start
+print(json.dumps(index.STARTUP))
+'''
+
+
+def cold_start(env):
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable,'-c',CHILD],cwd=ROOT,env=env)
+    phases = json.loads(output.decode().strip().splitlines()[-1])
+    phases['process'] = time.perf_counter() - start
+    return phases
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat',type=int,default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        if 'SPOTIFY_STORAGE' not in env:
+            env['SPOTIFY_STORAGE'] = storage.BACKEND = 'sqlite'
+            env['SQLITE_PATH'] = sqlite_store.SQLITE_PATH = os.path.join(directory,'startup.db')
+        storage.create_tables()
+        storage.add_user('bench')
+        storage.create_analytics_tables('bench')
+
+        for preload in ('0','1'):
+            runs = [cold_start(dict(env,SPOTIFY_PRELOAD=preload)) for i in range(args.repeat)]
+            print('\nSPOTIFY_PRELOAD={}'.format(preload))
+            for name in runs[0]:
+                print('{:<20} {:>10.1f} ms'.format(name,statistics.median(run[name] for run in runs) * 1000))
+
+
+if __name__ == '__main__':
+    main()
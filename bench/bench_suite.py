@@ -0,0 +1,189 @@
+#Times a first and an incremental sync, every storage read and every page
+#callback against synthetic libraries served by the fake Spotify server, and
+#appends the results to bench/results/suite.jsonl. Each run is compared with
+#the previous run for the same backend and library size; timings that got
+#slower by more than --threshold are flagged.
+#
+#    python -m bench.bench_suite --tracks 1000 10000 100000
+#
+#Uses SQLite in a temporary directory unless SPOTIFY_STORAGE=postgres is set,
+#in which case a user id unique to the run keeps the rows apart.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import api_cache
+import cache
+import fetcher
+import spotify
+import sqlite_store
+import storage
+import sync
+from bench.fake_spotify import FakeSpotify
+from bench.synthetic import make_library
+
+RESULTS = os.path.join(os.path.dirname(__file__),'results','suite.jsonl')
+
+
+def timed(func,*args,**kwargs):
+    start = time.perf_counter()
+    func(*args,**kwargs)
+    return time.perf_counter() - start
+
+#Median of `repeat` cold calls: the query cache is cleared before each one
+def median_cold(repeat,func,*args,**kwargs):
+    samples = []
+    for i in range(repeat):
+        cache.clear()
+        samples.append(timed(func,*args,**kwargs))
+    return statistics.median(samples)
+
+def queries(user,library):
+    count = storage.count_liked_songs(user)
+    last_page = max(0,(count - 1) // 50 * 50)
+    middle = storage.select_liked_songs_page(user,50,offset=count // 2)
+    after = (middle[-1][6],middle[-1][0]) if middle else None
+    year = storage.get_years(user)[-1][0]
+    artist_ids = list(library['artists'])[:5000]
+    album_ids = list(library['albums'])[:5000]
+    return {
+        'check_liked_songs': lambda: storage.check_liked_songs('liked_songs',user),
+        'count_liked_songs': lambda: storage.count_liked_songs(user),
+        'count_recent_songs': lambda: storage.count_recent_songs(user),
+        'select_liked_songs_page first': lambda: storage.select_liked_songs_page(user,50),
+        'select_liked_songs_page offset last': lambda: storage.select_liked_songs_page(user,50,offset=last_page),
+        'select_liked_songs_page keyset middle': lambda: storage.select_liked_songs_page(user,50,after=after),
+        'select_recent_songs_page first': lambda: storage.select_recent_songs_page(user,50),
+        'select_missing_artists 5k ids': lambda: storage.select_missing_artists(artist_ids),
+        'select_missing_albums 5k ids': lambda: storage.select_missing_albums(album_ids),
+        'get_years': lambda: storage.get_years(user),
+        'get_year_summary': lambda: storage.get_year_summary(user,year),
+        'refresh_analytics full': lambda: storage.refresh_analytics(user),
+        'get_genre_share': lambda: storage.get_genre_share(user,'liked',year),
+        'get_top_artists': lambda: storage.get_top_artists(user,'liked',year),
+        'get_listening': lambda: storage.get_listening(user,year),
+        'refresh_play_analytics full': lambda: storage.refresh_play_analytics(user),
+        'search_library two words': lambda: storage.search_library(user,'midnight river'),
+        'search_library prefix': lambda: storage.search_library(user,'mid'),
+        'search_library typo': lambda: storage.search_library(user,'mdnight'),
+    }
+
+def callbacks(user,count):
+    from pages import analytics, insights, liked_songs, recents, search, tools
+    year = storage.get_years(user)[-1][0]
+    last_page = max(1,-(-count // liked_songs.page_size))
+    return {
+        'liked_songs.layout': lambda: liked_songs.layout(user),
+        'liked_songs.pages first': lambda: liked_songs.pages(0,{},user),
+        'liked_songs.pages last': lambda: liked_songs.pages(last_page - 1,{},user),
+        'recents.layout': lambda: recents.layout(user),
+        'recents.pages first': lambda: recents.pages(0,{},user),
+        'analytics.layout': lambda: analytics.layout(user),
+        'analytics.year_options': lambda: analytics.year_options(user),
+        'analytics.analytics_display': lambda: analytics.analytics_display(year,user),
+        'insights.layout': lambda: insights.layout(user),
+        'insights.year_options': lambda: insights.year_options(user),
+        'insights.insights_display': lambda: insights.insights_display(year,'liked',user),
+        'search.layout': lambda: search.layout(user),
+        'search.search_results': lambda: search.search_results('midnight',user),
+        'tools.layout': lambda: tools.layout(user),
+    }
+
+def run(tracks,repeat,latency,directory):
+    library = make_library(tracks)
+    user = 'bench-{}'.format(tracks)
+    if storage.BACKEND == 'postgres':
+        user = '{}-{}'.format(user,int(time.time()))
+    else:
+        sqlite_store.SQLITE_PATH = os.path.join(directory,'{}.db'.format(tracks))
+        sqlite_store._local.conn = None
+
+    storage.create_tables()
+    server = FakeSpotify(library,latency=latency).start()
+    spotify.API_PREFIX = server.prefix
+    timings = {}
+    try:
+        timings['fetch_data first sync'] = timed(sync.fetch_data,user,full_sync=True)
+        timings['fetch_data incremental'] = timed(sync.fetch_data,user,full_sync=False)
+    finally:
+        server.stop()
+
+    for name,func in queries(user,library).items():
+        timings[name] = median_cold(repeat,func)
+    # The pages only answer for the user logged in to the session. Importing
+    # index starts the app's sync setup, without its scheduler here.
+    sync.SCHEDULER = False
+    import auth, index
+    with index.server.test_request_context():
+        auth.login(user)
+        for name,func in callbacks(user,storage.count_liked_songs(user)).items():
+            timings[name] = median_cold(repeat,func)
+    return timings
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git','rev-parse','--short','HEAD'],stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+def _previous(path,backend,tracks):
+    previous = None
+    if os.path.exists(path):
+        with open(path) as results:
+            for line in results:
+                record = json.loads(line)
+                if record['storage'] == backend and record['tracks'] == tracks:
+                    previous = record
+    return previous
+
+def report(record,previous,threshold):
+    print('\n{} tracks on {} ({})'.format(record['tracks'],record['storage'],record['revision']))
+    print('{:<40} {:>10} {:>10} {:>8}'.format('timing','ms','previous','ratio'))
+    for name,seconds in record['timings'].items():
+        line = '{:<40} {:>10.2f}'.format(name,seconds * 1000)
+        before = (previous or {}).get('timings',{}).get(name)
+        if before:
+            ratio = seconds / before
+            line += ' {:>10.2f} {:>8.2f}'.format(before * 1000,ratio)
+            if ratio > threshold and seconds - before > 0.001:
+                line += '  REGRESSION'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks',type=int,nargs='+',default=[1000,10000,100000])
+    parser.add_argument('--repeat',type=int,default=5)
+    parser.add_argument('--latency',type=float,default=0.0)
+    parser.add_argument('--threshold',type=float,default=1.25)
+    parser.add_argument('--results',default=RESULTS)
+    args = parser.parse_args()
+
+    if 'SPOTIFY_STORAGE' not in os.environ:
+        storage.BACKEND = 'sqlite'
+    spotify.spotify_init = lambda username: 'fake-token'
+    fetcher.BACKOFF = 0.01
+    api_cache.ENABLED = False
+    os.makedirs(os.path.dirname(args.results),exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for tracks in args.tracks:
+            record = {
+                'run': datetime.now().isoformat(timespec='seconds'),
+                'revision': _git_revision(),
+                'storage': storage.BACKEND,
+                'tracks': tracks,
+                'timings': run(tracks,args.repeat,args.latency,directory),
+            }
+            report(record,_previous(args.results,record['storage'],tracks),args.threshold)
+            with open(args.results,'a') as results:
+                results.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#Throughput of the transform stage on a synthetic library: saved-track pages
+#turned into loader rows through one dict per record with timestamps parsed
+#row by row (the old process_liked_songs path) next to spotify.track_columns.
+#Both filter on a high-water mark and build the tracks, track_artists and
+#liked_tracks rows the loader consumes. No database or server is needed.
+#
+#    python -m bench.bench_transform --tracks 100000
+import argparse
+import time
+from datetime import datetime
+
+import metrics
+import spotify
+from bench.synthetic import make_library
+
+
+def _parse(timestamp):
+    return datetime.fromisoformat(timestamp[:-1])
+
+def _records(page):
+    songs = []
+    for i in range(len(page)):
+        track = page[i]['track']
+        if track is None or track['id'] is None:
+            continue
+        temp_dict = {}
+        temp_dict['song_id'] = track['id']
+        temp_dict['song_name'] = track['name']
+        temp_dict['added_at'] = page[i]['added_at']
+        temp_dict['album'] = track['album']['id']
+        temp_dict['popularity'] = track['popularity']
+        temp_dict['preview_url'] = track['preview_url']
+        temp_dict['duration_ms'] = track['duration_ms']
+        temp_dict['artists'] = [artist['id'] for artist in track['artists'] if artist['id'] is not None]
+        songs.append(temp_dict.copy())
+    return songs
+
+def per_record(pages,since):
+    rows = 0
+    for page in pages:
+        songs = [song for song in _records(page) if _parse(song['added_at']) > since]
+        tracks = [[s['song_id'],s['song_name'],s['album'],s['popularity'],s['preview_url'],s['duration_ms']] for s in songs]
+        track_artists = [[s['song_id'],a,p] for s in songs for p,a in enumerate(s['artists'])]
+        liked = [['bench',s['song_id'],_parse(s['added_at'])] for s in songs]
+        periods = {(added_at.year,added_at.month) for added_at in map(_parse,(s['added_at'] for s in songs))}
+        rows += len(tracks) + len(track_artists) + len(liked)
+    return rows
+
+def columnar(pages,since):
+    rows = 0
+    for page in pages:
+        songs = spotify.track_columns(page,since)
+        tracks = list(zip(songs['song_id'],songs['song_name'],songs['album'],songs['popularity'],songs['preview_url'],songs['duration_ms']))
+        track_artists = [(s,a,p) for s,artists in zip(songs['song_id'],songs['artists']) for p,a in enumerate(artists)]
+        liked = [('bench',s,added_at) for s,added_at in zip(songs['song_id'],songs['added_at'])]
+        periods = {(added_at.year,added_at.month) for added_at in songs['added_at']}
+        rows += len(tracks) + len(track_artists) + len(liked)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracks',type=int,default=100000)
+    parser.add_argument('--repeat',type=int,default=5)
+    args = parser.parse_args()
+
+    metrics.ENABLED = False
+    library = make_library(args.tracks)
+    items = library['saved_tracks']
+    pages = [items[i:i+50] for i in range(0,len(items),50)]
+    # Keep roughly the newest half, as an incremental sync over a full listing would
+    since = sorted(_parse(i['added_at']) for i in items)[len(items) // 2]
+
+    print('{:>12} {:>10} {:>14} {:>10}'.format('transform','seconds','tracks/s','rows'))
+    for transform in (per_record,columnar):
+        best = None
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            rows = transform(pages,since)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best,elapsed)
+        print('{:>12} {:>10.3f} {:>14.0f} {:>10}'.format(transform.__name__,best,len(items) / best,rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _ms(timestamp):
+    return int(datetime.strptime(timestamp[:19],'%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+#Serves a library from bench.synthetic over the subset of the Web API that
+#spotify.py uses. `latency` delays every response and `throttle_every` answers
+#every n-th request with a 429 carrying `retry_after` in its Retry-After header.
+#Responses carry an ETag and a matching If-None-Match gets an empty 304.
+#Connections are kept alive as the real API does; `connections` counts them.
+class FakeSpotify(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self,library,port = 0,latency = 0.0,throttle_every = 0,retry_after = 0):
+        super().__init__(('127.0.0.1',port),_Handler)
+        self.library = library
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        self.not_modified = 0
+        self.connections = 0
+        self.counter_lock = threading.Lock()
+        self.recent_ms = [_ms(item['played_at']) for item in library['recently_played']]
+
+    @property
+    def prefix(self):
+        return 'http://127.0.0.1:{}/v1/'.format(self.server_address[1])
+
+    def start(self):
+        threading.Thread(target=self.serve_forever,daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; with Nagle on a kept-alive
+    # connection each response would wait for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.counter_lock:
+            self.server.connections += 1
+
+    def log_message(self,format,*args):
+        pass
+
+    def _send(self,status,body,headers = None):
+        payload = json.dumps(body).encode()
+        if status == 200:
+            etag = '"{}"'.format(hashlib.sha1(payload).hexdigest())
+            headers = dict(headers or {},ETag=etag)
+            if self.headers.get('If-None-Match') == etag:
+                with self.server.counter_lock:
+                    self.server.not_modified += 1
+                self.send_response(304)
+                self.send_header('ETag',etag)
+                self.send_header('Content-Length','0')
+                self.end_headers()
+                return
+        self.send_response(status)
+        self.send_header('Content-Type','application/json')
+        self.send_header('Content-Length',str(len(payload)))
+        for key,value in (headers or {}).items():
+            self.send_header(key,value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        with server.counter_lock:
+            server.requests += 1
+            throttle = server.throttle_every and server.requests % server.throttle_every == 0
+            if throttle:
+                server.throttled += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if throttle:
+            return self._send(429,{'error': {'status': 429,'message': 'API rate limit exceeded'}},
+                              {'Retry-After': str(server.retry_after)})
+
+        url = urlparse(self.path)
+        query = {key: values[0] for key,values in parse_qs(url.query).items()}
+        parts = url.path.strip('/').split('/')[1:]
+        library = server.library
+
+        if parts == ['me','tracks']:
+            offset = int(query.get('offset',0))
+            limit = int(query.get('limit',20))
+            items = library['saved_tracks'][offset:offset+limit]
+            total = len(library['saved_tracks'])
+            next_url = None
+            if offset + limit < total:
+                next_url = '{}me/tracks?offset={}&limit={}'.format(server.prefix,offset+limit,limit)
+            return self._send(200,{'items': items,'total': total,'limit': limit,'offset': offset,'next': next_url})
+
+        if parts == ['me','player','recently-played']:
+            return self._send(200,self._recently_played(query))
+
+        if len(parts) == 1 and parts[0] in ('albums','artists'):
+            objects = library[parts[0]]
+            ids = query.get('ids','').split(',') if query.get('ids') else []
+            return self._send(200,{parts[0]: [objects.get(i) for i in ids]})
+
+        if len(parts) == 2 and parts[0] in ('albums','artists'):
+            obj = library[parts[0]].get(parts[1])
+            if obj is None:
+                return self._send(404,{'error': {'status': 404,'message': 'Not found'}})
+            return self._send(200,obj)
+
+        self._send(404,{'error': {'status': 404,'message': 'Unknown path {}'.format(url.path)}})
+
+    def _recently_played(self,query):
+        server = self.server
+        items = server.library['recently_played']
+        limit = int(query.get('limit',20))
+        if 'after' in query:
+            after = int(query['after'])
+            newer = [i for i,ms in enumerate(server.recent_ms) if ms > after]
+            page = [items[i] for i in newer[-limit:]]
+            more = len(newer) > limit
+        elif 'before' in query:
+            before = int(query['before'])
+            older = [i for i,ms in enumerate(server.recent_ms) if ms < before]
+            page = [items[i] for i in older[:limit]]
+            more = len(older) > limit
+        else:
+            page = items[:limit]
+            more = len(items) > limit
+
+        cursors = None
+        next_url = None
+        if page:
+            cursors = {'after': str(_ms(page[0]['played_at'])),'before': str(_ms(page[-1]['played_at']))}
+            if more:
+                if 'after' in query:
+                    next_url = '{}me/player/recently-played?after={}&limit={}'.format(server.prefix,cursors['after'],limit)
+                else:
+                    next_url = '{}me/player/recently-played?before={}&limit={}'.format(server.prefix,cursors['before'],limit)
+        return {'items': page,'next': next_url,'cursors': cursors,'limit': limit}
@@ -0,0 +1,102 @@
+import random
+from datetime import datetime, timedelta
+
+
+#Words track, album and artist names are made of, so that searches match a
+#realistic spread of rows instead of every name sharing one prefix
+WORDS = ('midnight','river','golden','echo','summer','shadow','velvet','paper','neon','silver','broken','wild','ocean','fire',
+         'electric','dream','honey','winter','lonely','crystal','thunder','garden','satellite','empire','violet','runaway',
+         'heart','city','desert','moon','sugar','ghost','rebel','lights','stone','mirror','highway','blue','static','harbor',
+         'signal','paradise','storm','orchid','forever','glass','hollow','wolves','tides','parade','cherry','atlas','ember',
+         'kingdom','lantern','meadow','northern','october','phantom','quiet','radio','saturn','tiger','union','vapor','western',
+         'yellow','zero','anthem','bloom','canyon','diamond','eclipse','falcon','gravity','horizon','island','jungle','karma',
+         'legend','machine','nomad','orbit','prism','riot','sonic','thrill','utopia','voyage','wonder','arrow','bandit','cobalt',
+         'dawn','euphoria','fever','galaxy','haze','infinity','jade','kaleidoscope','lullaby','marble','nova','oasis','pilot')
+
+def _name(rng,words):
+    return ' '.join(word.capitalize() for word in rng.sample(WORDS,words))
+
+def _pick_genres(rng,genres,fan_out):
+    return rng.sample(genres,rng.randint(0,min(fan_out,len(genres))))
+
+#Generates a library shaped like the Spotify Web API responses: saved track
+#items newest first, album and artist objects keyed by id, and recently
+#played items newest first
+def make_library(tracks = 1000,albums = None,artists = None,genres = 50,genre_fan_out = 3,
+                 span_days = 5*365,recent_plays = 200,seed = 0):
+    rng = random.Random(seed)
+    # Names come from their own generator so the rest of the library is the
+    # same whatever the names are
+    names = random.Random(seed + 1)
+    albums = albums or max(1,tracks // 10)
+    artists = artists or max(1,tracks // 20)
+    genre_names = ['genre {}'.format(i) for i in range(genres)]
+
+    artist_objs = {}
+    for i in range(artists):
+        artist_id = 'ar{:020d}'.format(i)
+        artist_objs[artist_id] = {
+            'id': artist_id,
+            'name': _name(names,names.choice([1,2])),
+            'type': 'artist',
+            'popularity': rng.randint(0,100),
+            'followers': {'href': None,'total': rng.randint(0,5000000)},
+            'genres': _pick_genres(rng,genre_names,genre_fan_out),
+        }
+    artist_ids = list(artist_objs)
+
+    album_objs = {}
+    for i in range(albums):
+        album_id = 'al{:020d}'.format(i)
+        album_artists = rng.sample(artist_ids,min(len(artist_ids),rng.choice([1,1,1,2])))
+        album_objs[album_id] = {
+            'id': album_id,
+            'name': "{}'s {}".format(_name(names,1),_name(names,2)),
+            'type': 'album',
+            'popularity': rng.randint(0,100),
+            'genres': _pick_genres(rng,genre_names,genre_fan_out),
+            'artists': [{'id': a,'name': artist_objs[a]['name'],'type': 'artist'} for a in album_artists],
+        }
+    album_ids = list(album_objs)
+
+    newest = datetime(2024,1,1)
+    step = timedelta(days=span_days) / max(tracks,1)
+    track_objs = []
+    saved_tracks = []
+    for i in range(tracks):
+        album = album_objs[rng.choice(album_ids)]
+        track_artists = list(album['artists'])
+        if rng.random() < 0.2:
+            featured = rng.choice(artist_ids)
+            if featured not in [a['id'] for a in track_artists]:
+                track_artists.append({'id': featured,'name': artist_objs[featured]['name'],'type': 'artist'})
+        track = {
+            'id': 'tr{:020d}'.format(i),
+            'name': _name(names,names.choice([1,2,3])),
+            'type': 'track',
+            'album': {'id': album['id'],'name': album['name'],'type': 'album','artists': album['artists']},
+            'artists': track_artists,
+            'popularity': rng.randint(0,100),
+            'preview_url': None if rng.random() < 0.3 else 'https://p.scdn.co/mp3-preview/{}'.format(i),
+            'duration_ms': rng.randint(90000,420000),
+        }
+        track_objs.append(track)
+        added_at = newest - step * i
+        saved_tracks.append({'added_at': added_at.strftime('%Y-%m-%dT%H:%M:%SZ'),'track': track})
+
+    recently_played = []
+    played_at = newest
+    for i in range(min(recent_plays,tracks) if tracks else 0):
+        played_at = played_at - timedelta(seconds=rng.randint(120,3600))
+        recently_played.append({
+            'played_at': played_at.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'track': rng.choice(track_objs),
+            'context': None,
+        })
+
+    return {
+        'saved_tracks': saved_tracks,
+        'albums': album_objs,
+        'artists': artist_objs,
+        'recently_played': recently_played,
+    }
@@ -0,0 +1,153 @@
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+# Entries expire after TTL seconds; past MAX_ENTRIES or MAX_BYTES the least
+# recently used entries are evicted first
+TTL = float(os.getenv('QUERY_CACHE_TTL', '300'))
+MAX_ENTRIES = int(os.getenv('QUERY_CACHE_ENTRIES', '1024'))
+MAX_BYTES = int(os.getenv('QUERY_CACHE_BYTES', str(64 * 1024 * 1024)))
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_by_table = {}
+_generations = {}
+_shared = None
+_bytes = 0
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'evictions': 0,
+    'expirations': 0,
+    'invalidations': 0,
+}
+
+
+#Rough deep size of a query result: rows of tuples, dicts and scalars
+def _sizeof(value):
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_sizeof(k) + _sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_sizeof(item) for item in value)
+    return size
+
+def _drop(key):
+    global _bytes
+    expires, size, tables, shared, value = _entries.pop(key)
+    _bytes -= size
+    for table in tables:
+        keys = _by_table.get(table)
+        if keys is not None:
+            keys.discard(key)
+
+def _store(key, tables, shared, value):
+    size = _sizeof(value)
+    if size > MAX_BYTES:
+        return
+    global _bytes
+    if key in _entries:
+        _drop(key)
+    _entries[key] = (time.monotonic() + TTL, size, tables, shared, value)
+    _bytes += size
+    for table in tables:
+        _by_table.setdefault(table, set()).add(key)
+    while len(_entries) > MAX_ENTRIES or _bytes > MAX_BYTES:
+        _drop(next(iter(_entries)))
+        _stats['evictions'] += 1
+
+def _lookup(key, shared):
+    entry = _entries.get(key)
+    if entry is None:
+        return False, None
+    if entry[0] < time.monotonic():
+        _drop(key)
+        _stats['expirations'] += 1
+        return False, None
+    # Another process wrote to one of its tables since it was stored
+    if entry[3] != shared:
+        _drop(key)
+        _stats['invalidations'] += 1
+        return False, None
+    _entries.move_to_end(key)
+    return True, entry[4]
+
+#Lets invalidations reach every process that uses the same database. The
+#storage backend passes load(names), returning {name: generation}, and
+#bump(names), which increments them. Each lookup then compares the entry's
+#generations with the stored ones, so a write made by another gunicorn
+#worker is seen on the next read instead of after TTL.
+def share_generations(load, bump):
+    global _shared
+    _shared = (load, bump)
+
+def _shared_generations(tables):
+    if _shared is None:
+        return None
+    generations = _shared[0](tables)
+    return tuple(generations.get(table, 0) for table in tables)
+
+#Caches a read function's result per arguments. `tables` lists every table
+#the query reads, so a write to any of them invalidates the entry. A name
+#containing {} is filled in with the first argument, e.g. 'liked_tracks:{}'
+#for a per-user read, so only writes for that user invalidate it.
+def cached(*tables):
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # Positional and keyword calls name the same entry
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (func.__qualname__, tuple(bound.arguments.values()))
+            scoped = tuple(table.format(*key[1][:1]) for table in tables)
+            shared = _shared_generations(scoped)
+            with _lock:
+                found, value = _lookup(key, shared)
+                if found:
+                    _stats['hits'] += 1
+                    return value
+                _stats['misses'] += 1
+                generations = tuple(_generations.get(table, 0) for table in scoped)
+
+            value = func(*args, **kwargs)
+
+            with _lock:
+                # Skip storing when a table was written while the query ran
+                if generations == tuple(_generations.get(table, 0) for table in scoped):
+                    _store(key, scoped, shared, value)
+            return value
+        return wrapper
+    return decorator
+
+def invalidate(*tables):
+    with _lock:
+        for table in tables:
+            _generations[table] = _generations.get(table, 0) + 1
+            for key in list(_by_table.pop(table, ())):
+                if key in _entries:
+                    _drop(key)
+                    _stats['invalidations'] += 1
+    if _shared is not None and tables:
+        _shared[1](tables)
+
+def clear():
+    global _bytes
+    with _lock:
+        _entries.clear()
+        _by_table.clear()
+        _bytes = 0
+
+def stats():
+    with _lock:
+        res = dict(_stats)
+        res['entries'] = len(_entries)
+        res['bytes'] = _bytes
+    lookups = res['hits'] + res['misses']
+    res['hit_ratio'] = res['hits'] / lookups if lookups else 0.0
+    return res
@@ -0,0 +1,68 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from spotipy.exceptions import SpotifyException
+
+# Number of Spotify requests allowed in flight at once
+CONCURRENCY = int(os.getenv('SPOTIFY_CONCURRENCY', '4'))
+# How often a rate limited (429) request is retried before giving up
+MAX_RETRIES = int(os.getenv('SPOTIFY_MAX_RETRIES', '5'))
+# Base delay for exponential backoff when a 429 carries no Retry-After header
+BACKOFF = float(os.getenv('SPOTIFY_BACKOFF', '0.5'))
+
+_throttle_lock = threading.Lock()
+_throttle_until = 0.0
+
+
+#A 429 pauses every worker, not only the one that received it
+def _wait_for_throttle():
+    with _throttle_lock:
+        delay = _throttle_until - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+def _throttle(delay):
+    global _throttle_until
+    with _throttle_lock:
+        _throttle_until = max(_throttle_until, time.monotonic() + delay)
+
+def retry_delay(error,attempt):
+    retry_after = (error.headers or {}).get('Retry-After')
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return BACKOFF * 2 ** attempt
+
+#Calls func, retrying on 429 after the server's Retry-After or an exponential backoff
+def call_with_retry(func,*args,**kwargs):
+    attempt = 0
+    while True:
+        _wait_for_throttle()
+        try:
+            return func(*args,**kwargs)
+        except SpotifyException as error:
+            if error.http_status != 429 or attempt >= MAX_RETRIES:
+                raise
+            _throttle(retry_delay(error,attempt))
+            attempt += 1
+
+#Yields func(arg) for every arg, in input order, with at most `workers`
+#requests running and at most twice that many results waiting to be consumed
+def fetch_ordered(func,args,workers = None):
+    workers = workers or CONCURRENCY
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for arg in args:
+            pending.append(executor.submit(call_with_retry,func,arg))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def fetch_all(func,args,workers = None):
+    return list(fetch_ordered(func,args,workers))
@@ -1,14 +1,133 @@
 # Run this app with `python app.py` and
 # visit http://127.0.0.1:8050/ in your web browser.
+#
+# Under gunicorn serve `index:server`. SPOTIFY_PRELOAD=1 loads the storage
+# backend and the Spotify client while the app starts rather than on first
+# use; with `gunicorn --preload` that happens once, before the workers fork.
+import time
+_started = time.perf_counter()
 
-from dash import Dash, html
-import dash_bootstrap_components as dbc
-import dash
+import logging
+import os
+from contextlib import contextmanager
 
-app = Dash(__name__, external_stylesheets=[
-           dbc.themes.BOOTSTRAP], use_pages=True)
+logger = logging.getLogger(__name__)
+
+PRELOAD = os.getenv('SPOTIFY_PRELOAD', '0') not in ('0', 'false')
+# Seconds spent in each startup phase, logged and served with /metrics
+STARTUP = {}
+
+
+@contextmanager
+def startup_phase(name):
+    start = time.perf_counter()
+    yield
+    STARTUP[name] = time.perf_counter() - start
+
+
+with startup_phase('import_dash'):
+    from dash import Dash, html
+    import dash_bootstrap_components as dbc
+    import dash
+    from flask import Response
+
+with startup_phase('import_app'):
+    import api_cache
+    import cache
+    import metrics
+    import storage
+    import sync
+
+# Registers every module under pages/; they import neither the Spotify client
+# nor a database driver. Without suppress_callback_exceptions Dash would call
+# every page's layout, and so query the database, to validate the callbacks on
+# the first request.
+with startup_phase('pages'):
+    app = Dash(__name__, external_stylesheets=[
+               dbc.themes.BOOTSTRAP], use_pages=True, suppress_callback_exceptions=True)
 
 app.layout = html.Div([dash.page_container])
+server = app.server
+# Signs the session cookie that holds the logged-in user, see auth.py. Every
+# worker process has to use the same key; the random one only suits a single
+# process.
+server.secret_key = os.getenv('SECRET_KEY') or os.urandom(32)
+
+
+# Shared by every request of the process: the storage backend with its SQL
+# statements and the Spotify client used by syncs. The Dash bootstrap requests
+# are served once too, as serializing the first layout makes plotly import
+# numpy. Connections are still opened on first use, so nothing here is shared
+# across a fork.
+def preload():
+    storage.backend()
+    import spotify
+    client = server.test_client()
+    for path in ('/', '/_dash-layout', '/_dash-dependencies'):
+        client.get(path)
+
+# The first request of the process pays for whatever was deferred; the time
+# from its arrival to the first response is recorded as first_response
+_first_request = None
+
+@server.before_request
+def _first_request_started():
+    global _first_request
+    if _first_request is None:
+        _first_request = time.perf_counter()
+
+@server.after_request
+def _first_response(response):
+    if 'first_response' not in STARTUP and _first_request is not None:
+        STARTUP['first_response'] = time.perf_counter() - _first_request
+        logger.info('first response after %.0f ms', STARTUP['first_response'] * 1000)
+    return response
+
+
+# Prometheus scrape target: timing spans, SQL histograms and cache/pool counters
+@app.server.route('/metrics')
+def serve_metrics():
+    stats = {
+        'spotify_app_query_cache': cache.stats(),
+        'spotify_app_api_cache': api_cache.stats(),
+        'spotify_app_startup_seconds': STARTUP,
+    }
+    pool_stats = getattr(storage.backend(), 'pool_stats', None)
+    if pool_stats is not None:
+        stats['spotify_app_db_pool'] = pool_stats()
+    return Response(metrics.render(stats), mimetype='text/plain; version=0.0.4')
+
+
+if PRELOAD:
+    with startup_phase('preload'):
+        preload()
+    # The warm-up requests do not count as the first response
+    _first_request = None
+    del STARTUP['first_response']
+
+# Every process serving the app sets up the schema and starts collecting
+# recent plays for all stored users as it starts, whether or not anyone logs
+# in. Under `gunicorn --preload` the workers do it after the fork, so the
+# master opens no database connection and runs no thread they would inherit.
+# `python index.py` starts it in the serving process below.
+if __name__ != '__main__':
+    with startup_phase('sync'):
+        if PRELOAD:
+            os.register_at_fork(after_in_child=sync.start)
+        else:
+            sync.start()
+
+STARTUP['total'] = time.perf_counter() - _started
+
+
+def startup_report():
+    return 'startup ' + ', '.join('{} {:.0f} ms'.format(name, seconds * 1000) for name, seconds in STARTUP.items())
+
 
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    logging.basicConfig(level=logging.INFO)
+    logger.info(startup_report())
+    # The debug reloader runs this file twice; only the serving process syncs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        sync.start()
+    app.run(debug=True)
@@ -0,0 +1,187 @@
+import inspect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# In-process timing spans for the Spotify client, the storage backends and the
+# Dash callbacks, exposed in the Prometheus text format by render().
+# Every span counts calls, errors and returned rows and feeds a latency
+# histogram. SQL statements slower than SLOW_QUERY_SECONDS are logged with
+# their parameters; 0 turns the slow-query log off.
+ENABLED = os.getenv('METRICS', '1') not in ('0', 'false')
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', '0'))
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Logged statements and parameters are cut to this many characters
+SLOW_QUERY_CHARS = 2000
+
+slow_query_log = logging.getLogger('slow_query')
+
+_lock = threading.Lock()
+_spans = {}
+_queries = {}
+
+
+def _new_series():
+    return {'calls': 0, 'errors': 0, 'rows': 0, 'sum': 0.0, 'buckets': [0] * len(BUCKETS)}
+
+def _observe(series, key, seconds, rows = None, error = False):
+    with _lock:
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = _new_series()
+        entry['calls'] += 1
+        entry['sum'] += seconds
+        if error:
+            entry['errors'] += 1
+        if rows is not None:
+            entry['rows'] += rows
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                entry['buckets'][i] += 1
+                break
+
+def _rows(value):
+    return len(value) if isinstance(value, list) else None
+
+#Times the enclosed block as one call of kind/name
+@contextmanager
+def span(kind, name):
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        _observe(_spans, (kind, name), time.perf_counter() - start, error=error)
+
+#Passes a generator's items through, timing only what is spent inside it and
+#not in its consumer
+def _timed_iteration(iterator, key):
+    elapsed, items, error = 0.0, 0, False
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            except Exception:
+                error = True
+                raise
+            finally:
+                elapsed += time.perf_counter() - start
+            items += 1
+            yield item
+    finally:
+        iterator.close()
+        _observe(_spans, key, elapsed, items, error)
+
+#Decorator recording each call of the function as a span, with the length of
+#a list result as its row count. A returned generator is recorded once it has
+#been run, counting the items it yields.
+def timed(kind, name = None):
+    def decorator(func):
+        key = (kind, name or func.__name__)
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                value = func(*args, **kwargs)
+            except Exception:
+                _observe(_spans, key, time.perf_counter() - start, error=True)
+                raise
+            if inspect.isgenerator(value):
+                return _timed_iteration(value, key)
+            _observe(_spans, key, time.perf_counter() - start, _rows(value))
+            return value
+        return wrapper
+    return decorator
+
+#Wraps every public function defined in a module, called at the bottom of the
+#module as metrics.instrument(globals(), 'postgres'). Functions listed in
+#`exclude`, such as context managers, are left alone.
+def instrument(namespace, kind, exclude = ()):
+    for name, value in list(namespace.items()):
+        if (name.startswith('_') or name in exclude or not inspect.isfunction(value)
+                or value.__module__ != namespace['__name__']):
+            continue
+        namespace[name] = timed(kind, name)(value)
+
+def _clip(value):
+    text = value if isinstance(value, str) else repr(value)
+    return text if len(text) <= SLOW_QUERY_CHARS else text[:SLOW_QUERY_CHARS] + '...'
+
+#Records one SQL statement run by a backend. `statement` may be a callable so
+#that rendering the text is only paid for slow statements.
+def record_query(backend, seconds, statement, params = None, rows = None):
+    if not ENABLED:
+        return
+    _observe(_queries, (backend,), seconds, rows if rows is not None and rows >= 0 else None)
+    if SLOW_QUERY_SECONDS and seconds >= SLOW_QUERY_SECONDS:
+        if callable(statement):
+            statement = statement()
+        if isinstance(statement, bytes):
+            statement = statement.decode(errors='replace')
+        slow_query_log.warning('%s query took %.3fs: %s params=%s', backend, seconds,
+                               _clip(' '.join(str(statement).split())), _clip(params))
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _queries.clear()
+
+def snapshot():
+    with _lock:
+        return ({key: dict(entry, buckets=list(entry['buckets'])) for key, entry in _spans.items()},
+                {key: dict(entry, buckets=list(entry['buckets'])) for key, entry in _queries.items()})
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(pairs):
+    return '{' + ','.join('{}="{}"'.format(name, _label(value)) for name, value in pairs) + '}'
+
+def _histogram(lines, metric, help_text, series, label_names):
+    lines.append('# HELP {}_seconds {}'.format(metric, help_text))
+    lines.append('# TYPE {}_seconds histogram'.format(metric))
+    for key, entry in sorted(series.items()):
+        pairs = list(zip(label_names, key))
+        cumulative = 0
+        for bound, count in zip(BUCKETS, entry['buckets']):
+            cumulative += count
+            lines.append('{}_seconds_bucket{} {}'.format(metric, _labels(pairs + [('le', bound)]), cumulative))
+        lines.append('{}_seconds_bucket{} {}'.format(metric, _labels(pairs + [('le', '+Inf')]), entry['calls']))
+        lines.append('{}_seconds_sum{} {}'.format(metric, _labels(pairs), entry['sum']))
+        lines.append('{}_seconds_count{} {}'.format(metric, _labels(pairs), entry['calls']))
+    for suffix, field, text in (('errors_total', 'errors', 'failed calls'), ('rows_total', 'rows', 'rows returned')):
+        lines.append('# HELP {}_{} {}'.format(metric, suffix, text))
+        lines.append('# TYPE {}_{} counter'.format(metric, suffix))
+        for key, entry in sorted(series.items()):
+            lines.append('{}_{}{} {}'.format(metric, suffix, _labels(zip(label_names, key)), entry[field]))
+
+def _gauges(lines, metric, stats):
+    for name, value in sorted(stats.items()):
+        if isinstance(value, (int, float)):
+            lines.append('# TYPE {}_{} gauge'.format(metric, name))
+            lines.append('{}_{} {}'.format(metric, name, value))
+
+#Prometheus text exposition of every span and SQL histogram plus the query
+#cache, API cache and connection pool counters handed in as `stats`
+def render(stats = None):
+    spans, queries = snapshot()
+    lines = []
+    _histogram(lines, 'spotify_app_span', 'time spent in instrumented functions', spans, ('kind', 'name'))
+    _histogram(lines, 'spotify_app_sql', 'time spent running SQL statements', queries, ('backend',))
+    for metric, values in (stats or {}).items():
+        _gauges(lines, metric, values)
+    return '\n'.join(lines) + '\n'
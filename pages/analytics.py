@@ -1,22 +1,30 @@
 from dash import dcc,callback
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input,Output
+from dash.dependencies import Input,Output,State
 from dash import html
 import dash
-import pandas as pd
-import postgres
+from dash.exceptions import PreventUpdate
+import auth
+import metrics
+import storage
+from urllib.parse import unquote
 
 dash.register_page(__name__,path_template='/analytics/<username>')
 
+@metrics.timed('layout','analytics.layout')
 def layout(username = None):
 
-    years  = list(postgres.get_years())
+    user = unquote(str(username))
+    if not auth.authorized(user):
+        return auth.login_prompt()
 
     navbar = dbc.NavbarSimple(
     children=[
         dbc.NavItem(dbc.NavLink("Liked Songs", href=f'http://localhost:8050/liked/{username}',id='LikedSongs')),
         dbc.NavItem(dbc.NavLink("Recents", href=f'http://localhost:8050/recents/{username}',id="Recents",)),
         dbc.NavItem(dbc.NavLink("Analytics", href=f'http://localhost:8050/analytics/{username}',id="Analytics")),
+        dbc.NavItem(dbc.NavLink("Insights", href=f'http://localhost:8050/insights/{username}',id="Insights")),
+        dbc.NavItem(dbc.NavLink("Search", href=f'http://localhost:8050/search/{username}',id="Search")),
         dbc.NavItem(dbc.NavLink("Back", href=f'http://localhost:8050/tools/{username}',id="Back"))
     ],
     brand="Spotify Analyzer",
@@ -26,55 +34,63 @@ def layout(username = None):
 
     return html.Div([ 
         navbar,
-        html.Div([dcc.Dropdown([year[0] for year in years],placeholder='Select year',id='year_drop')],style={'margin':'0 500px',"padding-top":'20px'}),
+        dcc.Store(id='analytics_user',data=user),
+        html.Div([dcc.Dropdown([],placeholder='Select year',id='year_drop')],style={'margin':'0 500px',"padding-top":'20px'}),
         html.Div(children = [],id='target_div',style={'margin':'30px 200px'}) 
     ])
 
+# The years are filled in after the page renders, so the layout needs no query
 @callback(
-    Output('target_div','children'),
-    [Input('year_drop','value')]
+    Output('year_drop','options'),
+    [Input('analytics_user','data')]
 )
+@metrics.timed('callback','analytics.year_options')
+def year_options(user):
+    if not auth.authorized(user):
+        raise PreventUpdate
+    return [year[0] for year in storage.get_years(user)]
 
-def analytics_display(value):
+@callback(
+    Output('target_div','children'),
+    [Input('year_drop','value')],
+    [State('analytics_user','data')]
+)
+@metrics.timed('callback','analytics.analytics_display')
+def analytics_display(value,user):
+    if not auth.authorized(user):
+        raise PreventUpdate
     if value is not None:
-        albums = postgres.get_albums_for_year(value)
-        most_pop_list = []
-        most_names_list = []
-        most_populars = postgres.get_popular_for_year(value,'desc')
-        for i in range(1,13):
-            most_pop_list.append(0)
-            most_names_list.append('NONE')
-            for j in most_populars:
-                if j[4] == i:
-                    most_pop_list[i-1] = j[2]*10 + 100
-                    most_names_list[i-1] = j[0]
+        summary = storage.get_year_summary(user,value)
+
+        # Tracks Spotify reports no popularity for are drawn as empty bars
+        most_pop_list = [song[2]*10 + 100 if song and song[2] is not None else 0 for song in summary['most_popular']]
+        most_names_list = [song[0] if song else 'NONE' for song in summary['most_popular']]
 
         most_popular = dcc.Graph(
             figure= {'data': [ {'x': [i for i in range(1,13)],'type':'bar','y':most_pop_list,'text':most_names_list} ] ,'layout':{'title':'Most Popular Songs Graph'}}
         )
 
-        least_pop_list = []
-        least_names_list = []
-        least_populars = postgres.get_popular_for_year(value,'asc')
-        for i in range(1,13):
-            least_pop_list.append(0)
-            least_names_list.append('NONE')
-            for j in least_populars:
-                if j[4] == i:
-                    least_pop_list[i-1] = j[2]*10 + 100
-                    least_names_list[i-1] = j[0]
-        
+        least_pop_list = [song[2]*10 + 100 if song and song[2] is not None else 0 for song in summary['least_popular']]
+        least_names_list = [song[0] if song else 'NONE' for song in summary['least_popular']]
+
         least_popular = dcc.Graph(
             figure= {'data': [ {'x': [i for i in range(1,13)],'type':'bar','y':least_pop_list,'text':least_names_list} ] ,'layout':{'title':'Least Popular Songs Graph'}}
         )
 
-        df = pd.DataFrame(albums,columns=['ALBUM','SONGS COUNT'])
+        songs_count = dcc.Graph(
+            figure= {'data': [ {'x': [i for i in range(1,13)],'type':'bar','y':summary['songs_count'],'text':[f'{round(ms/60000)} min' for ms in summary['duration_ms']]} ] ,'layout':{'title':'Songs Liked Per Month'}}
+        )
+
+        with metrics.span('render','analytics.analytics_display'):
+            table = dbc.Table([html.Thead(html.Tr([html.Th('ALBUM'),html.Th('SONGS COUNT')])),
+                               html.Tbody([html.Tr([html.Td(album),html.Td(count)]) for album,count in summary['albums']])],
+                              striped=True, bordered=True,hover=True,style = {'padding-top':'45px','text-align':'center'})
 
         result = [html.H2("Your top 3 albums from that year are",style = {'color':'white','border-style':'solid','text-align':'center'}),
-             dbc.Table.from_dataframe(df, striped=True, bordered=True,hover=True, 
-                                      index=False,style = {'padding-top':'45px','text-align':'center'}),
+             table,
              most_popular,
-             least_popular
+             least_popular,
+             songs_count
             ]
         
         return result
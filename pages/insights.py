@@ -0,0 +1,112 @@
+from dash import dcc,callback
+import dash_bootstrap_components as dbc
+from dash.dependencies import Input,Output,State
+from dash import html
+import dash
+from dash.exceptions import PreventUpdate
+import auth
+import metrics
+import storage
+from urllib.parse import unquote
+
+dash.register_page(__name__,path_template='/insights/<username>')
+
+# Genres past this many in a year are drawn together as 'other'
+top_genres = 8
+
+@metrics.timed('layout','insights.layout')
+def layout(username = None):
+
+    user = unquote(str(username))
+    if not auth.authorized(user):
+        return auth.login_prompt()
+
+    navbar = dbc.NavbarSimple(
+    children=[
+        dbc.NavItem(dbc.NavLink("Liked Songs", href=f'http://localhost:8050/liked/{username}',id='LikedSongs')),
+        dbc.NavItem(dbc.NavLink("Recents", href=f'http://localhost:8050/recents/{username}',id="Recents",)),
+        dbc.NavItem(dbc.NavLink("Analytics", href=f'http://localhost:8050/analytics/{username}',id="Analytics")),
+        dbc.NavItem(dbc.NavLink("Insights", href=f'http://localhost:8050/insights/{username}',id="Insights")),
+        dbc.NavItem(dbc.NavLink("Search", href=f'http://localhost:8050/search/{username}',id="Search")),
+        dbc.NavItem(dbc.NavLink("Back", href=f'http://localhost:8050/tools/{username}',id="Back"))
+    ],
+    brand="Spotify Analyzer",
+    brand_href="http://localhost:8050/",
+    className='box-form left'
+    )
+
+    return html.Div([
+        navbar,
+        dcc.Store(id='insights_user',data=user),
+        html.Div([dcc.Dropdown([],placeholder='Select year',id='insights_year'),
+                  dcc.RadioItems([{'label': ' Likes','value': 'liked'},{'label': ' Plays','value': 'played'}],'liked',
+                                 id='insights_source',inline=True,style={'color':'white','padding-top':'10px'})],
+                 style={'margin':'0 500px',"padding-top":'20px'}),
+        html.Div(children = [],id='insights_div',style={'margin':'30px 200px'})
+    ])
+
+# Filled in after the page renders, like the analytics years
+@callback(
+    Output('insights_year','options'),
+    [Input('insights_user','data')]
+)
+@metrics.timed('callback','insights.year_options')
+def year_options(user):
+    if not auth.authorized(user):
+        raise PreventUpdate
+    return storage.get_insight_years(user)
+
+@callback(
+    Output('insights_div','children'),
+    [Input('insights_year','value'),Input('insights_source','value')],
+    [State('insights_user','data')]
+)
+@metrics.timed('callback','insights.insights_display')
+def insights_display(year,source,user):
+    if not auth.authorized(user):
+        raise PreventUpdate
+    if year is None:
+        return [html.H1("Choose a year from the dropdown to see results",style = {'border-style':'solid','font-size':'7vmax','color':'white','text-align':'center'})]
+
+    months = [i for i in range(1,13)]
+    by = 'Likes' if source == 'liked' else 'Plays'
+
+    # Each genre's part of the month's songs, for the year's biggest genres
+    share = storage.get_genre_share(user,source,year)
+    totals = {}
+    for month,genre,songs,duration_ms in share:
+        totals[genre] = totals.get(genre,0) + songs
+    counts = {genre: [0]*12 for genre in sorted(totals,key=lambda genre: (-totals[genre],genre))[:top_genres]}
+    counts['other'] = [0]*12
+    for month,genre,songs,duration_ms in share:
+        counts[genre if genre in counts else 'other'][month-1] += songs
+    month_totals = [sum(column) for column in zip(*counts.values())]
+
+    genre_share = dcc.Graph(
+        figure= {'data': [ {'x': months,'y': [round(100*songs/total,1) if total else 0 for songs,total in zip(counts[genre],month_totals)],
+                            'name': genre,'type':'scatter','stackgroup':'genres'} for genre in counts if any(counts[genre]) ],
+                 'layout':{'title':'Genre Share Per Month (% of {})'.format(by)}}
+    )
+
+    artists = storage.get_top_artists(user,source,year)[::-1]
+    top_artists = dcc.Graph(
+        figure= {'data': [ {'x': [artist[1] for artist in artists],'y': [artist[0] for artist in artists],'type':'bar','orientation':'h',
+                            'text': [f'{artist[3]} followers, popularity {artist[4]}' for artist in artists]} ],
+                 'layout':{'title':'Top Artists By {}'.format(by),'margin':{'l':160}}}
+    )
+
+    # Listening time always comes from plays
+    minutes_by_month = [0]*12
+    minutes_by_hour = [0]*24
+    for month,hour,plays,duration_ms in storage.get_listening(user,year):
+        minutes_by_month[month-1] += duration_ms / 60000
+        minutes_by_hour[hour] += duration_ms / 60000
+
+    listening_month = dcc.Graph(
+        figure= {'data': [ {'x': months,'type':'bar','y': [round(minutes) for minutes in minutes_by_month]} ] ,'layout':{'title':'Minutes Listened Per Month'}}
+    )
+    listening_hour = dcc.Graph(
+        figure= {'data': [ {'x': [i for i in range(24)],'type':'bar','y': [round(minutes) for minutes in minutes_by_hour]} ] ,'layout':{'title':'Minutes Listened By Hour Of Day (UTC)'}}
+    )
+
+    return [genre_share,top_artists,listening_month,listening_hour]
\ No newline at end of file
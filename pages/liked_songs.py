@@ -1,27 +1,38 @@
-from dash import dcc,callback
+from dash import dcc,callback,dash_table
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
 from dash import html
 import dash
-import pandas as pd
-import postgres
+from dash.exceptions import PreventUpdate
+import auth
+import metrics
+import storage
 import math
+from urllib.parse import unquote
+from datetime import datetime
 
 dash.register_page(__name__, path_template='/liked/<username>')
 
+page_size = 50
+column_names = ['SONG','ALBUM','ARTISTS','POPULARITY']
 
+
+@metrics.timed('layout','liked_songs.layout')
 def layout(username=None):
 
-    liked_songs = postgres.select_liked_songs(0)
-    number_of_liked_songs = len(liked_songs)
-    page_size = 50
-    number_of_pages = math.ceil(number_of_liked_songs/page_size)
+    user = unquote(str(username))
+    if not auth.authorized(user):
+        return auth.login_prompt()
+    number_of_liked_songs = storage.count_liked_songs(user)
+    number_of_pages = max(1,math.ceil(number_of_liked_songs/page_size))
 
     navbar = dbc.NavbarSimple(
     children=[
         dbc.NavItem(dbc.NavLink("Liked Songs", href=f'http://localhost:8050/liked/{username}',id='LikedSongs')),
         dbc.NavItem(dbc.NavLink("Recents", href=f'http://localhost:8050/recents/{username}',id="Recents",)),
         dbc.NavItem(dbc.NavLink("Analytics", href=f'http://localhost:8050/analytics/{username}',id="Analytics")),
+        dbc.NavItem(dbc.NavLink("Insights", href=f'http://localhost:8050/insights/{username}',id="Insights")),
+        dbc.NavItem(dbc.NavLink("Search", href=f'http://localhost:8050/search/{username}',id="Search")),
         dbc.NavItem(dbc.NavLink("Back", href=f'http://localhost:8050/tools/{username}',id="Back"))
     ],
     brand="Spotify Analyzer",
@@ -31,25 +42,43 @@ def layout(username=None):
 
     return html.Div([
         navbar,
-        html.Div([dcc.Slider(id='Pagination',min=1,max=number_of_pages,step=1,value=1,marks={i : str(i) for i in range(1,number_of_pages+1)})],style={'margin':'0 40px'}),
-        html.Div(children=[],id='liked_table',style={'margin':'0 40px'}) 
+        dcc.Store(id='liked_user',data=user),
+        dcc.Store(id='liked_cursors',data={}),
+        # Only the current page is sent to the browser; the table's own pager
+        # asks for the others, and only the visible rows are rendered
+        html.Div([dash_table.DataTable(id='liked_table',columns=[{'name': name,'id': name} for name in column_names],
+                                       page_action='custom',page_current=0,page_size=page_size,page_count=number_of_pages,
+                                       virtualization=True,fixed_rows={'headers': True},
+                                       style_table={'height': '75vh','overflowY': 'auto'},style_cell={'textAlign': 'left'})],
+                 style={'margin':'0 40px'})
     ],style={})
 
 
 @callback(
-    Output('liked_table','children'),
-    [Input('Pagination','value')],
-    [State('Pagination','max')]
+    Output('liked_table','data'),
+    Output('liked_cursors','data'),
+    [Input('liked_table','page_current')],
+    [State('liked_cursors','data'),State('liked_user','data')]
 )
-def pages(active_page,max):
+@metrics.timed('callback','liked_songs.pages')
+def pages(page_current,cursors,user):
+    if not auth.authorized(user):
+        raise PreventUpdate
+
+    active_page = (page_current or 0) + 1
 
-    column_names = ['song_id','SONG','ALBUM','ARTISTS','POPULARITY','preview_url']
-    
-    if active_page == max:
-        liked_songs = postgres.select_liked_songs(active_page*50-50)
+    # Walk forward from the last row of the previous page when we have seen it,
+    # otherwise jump straight to the page by offset
+    after = cursors.get(str(active_page-1))
+    if after is not None:
+        liked_songs = storage.select_liked_songs_page(user,page_size,after=(datetime.fromisoformat(after[0]),after[1]))
     else:
-        liked_songs = postgres.select_liked_songs(active_page*50-50,active_page*50)
+        liked_songs = storage.select_liked_songs_page(user,page_size,offset=active_page*page_size-page_size)
+
+    if liked_songs:
+        cursors[str(active_page)] = [liked_songs[-1][6].isoformat(),liked_songs[-1][0]]
 
-    df = pd.DataFrame(liked_songs,columns=column_names)
-    df = df.drop(['song_id','preview_url'],axis=1)
-    return dbc.Table.from_dataframe(df, striped=True, bordered=True,hover=True)
\ No newline at end of file
+    # Rows go out as compact records of the shown columns
+    with metrics.span('render','liked_songs.pages'):
+        rows = [dict(zip(column_names,song[1:5])) for song in liked_songs]
+    return rows,cursors
\ No newline at end of file
@@ -0,0 +1,69 @@
+from dash import dcc,callback,dash_table
+import dash_bootstrap_components as dbc
+from dash.dependencies import Input, Output, State
+from dash import html
+import dash
+from dash.exceptions import PreventUpdate
+import auth
+import metrics
+import storage
+from urllib.parse import unquote
+
+dash.register_page(__name__, path_template='/search/<username>')
+
+results = 50
+column_names = ['SONG','ALBUM','ARTISTS','POPULARITY']
+# Shorter searches match most of a library, so they are not sent
+min_query_length = 2
+
+
+@metrics.timed('layout','search.layout')
+def layout(username=None):
+
+    user = unquote(str(username))
+    if not auth.authorized(user):
+        return auth.login_prompt()
+
+    navbar = dbc.NavbarSimple(
+    children=[
+        dbc.NavItem(dbc.NavLink("Liked Songs", href=f'http://localhost:8050/liked/{username}',id='LikedSongs')),
+        dbc.NavItem(dbc.NavLink("Recents", href=f'http://localhost:8050/recents/{username}',id="Recents",)),
+        dbc.NavItem(dbc.NavLink("Analytics", href=f'http://localhost:8050/analytics/{username}',id="Analytics")),
+        dbc.NavItem(dbc.NavLink("Insights", href=f'http://localhost:8050/insights/{username}',id="Insights")),
+        dbc.NavItem(dbc.NavLink("Search", href=f'http://localhost:8050/search/{username}',id="Search")),
+        dbc.NavItem(dbc.NavLink("Back", href=f'http://localhost:8050/tools/{username}',id="Back"))
+    ],
+    brand="Spotify Analyzer",
+    brand_href="http://localhost:8050/",
+    className='box-form left'
+    )
+
+    return html.Div([
+        navbar,
+        dcc.Store(id='search_user',data=user),
+        # Results follow the typing, once it pauses for a moment
+        html.Div([dcc.Input(id='search_query',type='search',placeholder='Search songs, albums and artists',debounce=0.15,
+                            style={'width':'100%'})],
+                 style={'margin':'0 500px',"padding-top":'20px'}),
+        html.Div([dash_table.DataTable(id='search_table',columns=[{'name': name,'id': name} for name in column_names],data=[],
+                                       page_size=results,fixed_rows={'headers': True},
+                                       style_table={'height': '70vh','overflowY': 'auto'},style_cell={'textAlign': 'left'})],
+                 style={'margin':'20px 40px'})
+    ],style={})
+
+
+@callback(
+    Output('search_table','data'),
+    [Input('search_query','value')],
+    [State('search_user','data')]
+)
+@metrics.timed('callback','search.search_results')
+def search_results(query,user):
+    if not auth.authorized(user):
+        raise PreventUpdate
+    if not query or len(query.strip()) < min_query_length:
+        return []
+    songs = storage.search_library(user,query.strip(),results)
+    with metrics.span('render','search.search_results'):
+        rows = [dict(zip(column_names,song[1:5])) for song in songs]
+    return rows
\ No newline at end of file
@@ -1,17 +1,28 @@
 import dash
-from dash import html
+from dash import dcc, html, callback
+from dash.dependencies import Input, Output, State
 import dash_bootstrap_components as dbc
+from urllib.parse import unquote
+import auth
+import metrics
+import sync
 
 
 dash.register_page(__name__,path_template='/tools/<username>')
 
+@metrics.timed('layout','tools.layout')
 def layout(username = None):
 
+    if not auth.authorized(unquote(str(username))):
+        return auth.login_prompt()
+
     navbar = dbc.NavbarSimple(
     children=[
         dbc.NavItem(dbc.NavLink("Liked Songs", href=f'http://localhost:8050/liked/{username}',id='LikedSongs')),
         dbc.NavItem(dbc.NavLink("Recents", href=f'http://localhost:8050/recents/{username}',id="Recents",)),
-        dbc.NavItem(dbc.NavLink("Analytics", href=f'http://localhost:8050/analytics/{username}',id="Analytics"))
+        dbc.NavItem(dbc.NavLink("Analytics", href=f'http://localhost:8050/analytics/{username}',id="Analytics")),
+        dbc.NavItem(dbc.NavLink("Insights", href=f'http://localhost:8050/insights/{username}',id="Insights")),
+        dbc.NavItem(dbc.NavLink("Search", href=f'http://localhost:8050/search/{username}',id="Search"))
     ],
     brand="Spotify Analyzer",
     brand_href="http://localhost:8050/",
@@ -23,6 +34,29 @@ def layout(username = None):
     return html.Div([navbar,
         html.Div([html.H1("Hello",style={'font-size':'10vmax','color':'white'}), 
                   html.H1(first_name ,style={'font-size':'10vmax','color':'white'}),
-                  html.H5("use the navigation links to access various features of the tool",style={'color':'white'})]
-                  ,style={"padding-left":"25px","padding-top":'10px'})
-    ],style={'width':'100vw'})    
+                  html.H5("use the navigation links to access various features of the tool",style={'color':'white'}),
+                  html.H5(id='sync_status',style={'color':'white'})]
+                  ,style={"padding-left":"25px","padding-top":'10px'}),
+        dcc.Store(id='sync_user',data=unquote(str(username))),
+        dcc.Interval(id='sync_interval',interval=2000)
+    ],style={'width':'100vw'})
+
+
+@callback(
+    Output('sync_status','children'),
+    Output('sync_interval','disabled'),
+    [Input('sync_interval','n_intervals')],
+    [State('sync_user','data')]
+)
+@metrics.timed('callback','tools.show_sync_status')
+def show_sync_status(n_intervals,username):
+    if not auth.authorized(username):
+        return '',True
+    status = sync.sync_status(username)
+    if status is None:
+        return '',True
+    if status['state'] in ('queued','running'):
+        return 'Syncing your library: {} ({:.0%})'.format(status['stage'] or 'waiting',status['progress']),False
+    if status['state'] in ('failed','skipped'):
+        return 'Sync {}: {}'.format(status['state'],status['error']),True
+    return 'Library synced at {:%H:%M}'.format(status['finished_at']),True
@@ -1,190 +1,520 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
-from psycopg2.extras import execute_values
+from psycopg2 import pool, sql
+
+import metrics
+import storage
+
+# Pool sizing, overridable per deployment. POOL_MIN connections are kept open
+# while idle, at most POOL_MAX are checked out at once and callers wait up to
+# POOL_TIMEOUT seconds for a free one.
+POOL_MIN = int(os.getenv('POSTGRES_POOL_MIN', '2'))
+POOL_MAX = int(os.getenv('POSTGRES_POOL_MAX', '10'))
+POOL_TIMEOUT = float(os.getenv('POSTGRES_POOL_TIMEOUT', '30'))
+# Connections idle for longer than this are pinged before being handed out
+POOL_CHECK_AFTER = float(os.getenv('POSTGRES_POOL_CHECK_AFTER', '60'))
+
+_pool = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+_init_lock = threading.Lock()
+_last_used = {}
+_pool_metrics = {
+    'checkouts': 0,
+    'timeouts': 0,
+    'discarded': 0,
+    'in_use': 0,
+    'wait_seconds_total': 0.0,
+    'wait_seconds_max': 0.0,
+    'checkout_seconds_total': 0.0,
+    'checkout_seconds_max': 0.0,
+}
+
+
+#Every statement in sql/, read once at import by file name
+STATEMENTS = storage.load_statements(os.path.join(os.path.dirname(os.path.abspath(__file__)),'sql'))
+
+# Read statements behind every page view, prepared server-side the first time
+# a pooled connection runs them, with the types of their parameters.
+# POSTGRES_PREPARE=0 turns this off, e.g. behind a transaction-mode pgbouncer.
+PREPARE = os.getenv('POSTGRES_PREPARE', '1') not in ('0', 'false')
+PREPARED = {
+    'view_liked_songs_page': {'user_id': 'varchar','after_added_at': 'timestamp','after_song_id': 'varchar','limit': 'bigint','offset': 'bigint'},
+    'view_recents_page': {'user_id': 'varchar','after_added_at': 'timestamp','after_song_id': 'varchar','limit': 'bigint','offset': 'bigint'},
+    'count_liked_songs': {'user_id': 'varchar'},
+    'count_recents': {'user_id': 'varchar'},
+    'get_years': {'user_id': 'varchar'},
+    'get_year_summary': {'user_id': 'varchar','year': 'integer'},
+    'get_insight_years': {'user_id': 'varchar'},
+    'get_genre_share': {'user_id': 'varchar','source': 'varchar','year': 'integer'},
+    'get_top_artists': {'user_id': 'varchar','source': 'varchar','year': 'integer','limit': 'bigint'},
+    'get_listening': {'user_id': 'varchar','year': 'integer'},
+    'search_corrections': {'terms': 'varchar[]','user_id': 'varchar','corrections': 'bigint'},
+    'search_library': {'match': 'text','user_id': 'varchar','limit': 'bigint'},
+    'select_missing_artists': {'ids': 'varchar[]'},
+    'select_missing_albums': {'ids': 'varchar[]'},
+}
+
+#PREPARE and EXECUTE statements for a registered query, with its %(name)s
+#parameters numbered in order of first use and %% unescaped, as PREPARE is
+#sent without parameters. The EXECUTE sets a savepoint in the same round trip
+#so that a failure can be undone on its own.
+def _prepared_statement(name,types):
+    order = []
+    def number(match):
+        if match.group(1) not in order:
+            order.append(match.group(1))
+        return '${}'.format(order.index(match.group(1)) + 1)
+    body = re.sub(r'%\((\w+)\)s',number,STATEMENTS[name]).replace('%%','%')
+    prepare = sql.SQL('PREPARE {} ({}) AS {}').format(
+        sql.Identifier(name),sql.SQL(',').join(sql.SQL(types[param]) for param in order),sql.SQL(body))
+    execute = sql.SQL('SAVEPOINT prepared_statement; EXECUTE {} ({})').format(
+        sql.Identifier(name),sql.SQL(',').join(sql.Placeholder(param) for param in order))
+    return prepare,execute
+
+_prepared = {name: _prepared_statement(name,types) for name,types in PREPARED.items()}
+
+#Connection that remembers which statements it has prepared
+class StatementConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+#Cursor that reports each statement's run time to metrics and the slow-query log
+class TimedCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars = None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            metrics.record_query('postgres', time.perf_counter() - start, lambda: self.query or str(query), vars, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            metrics.record_query('postgres', time.perf_counter() - start, lambda: self.query or str(query), None, self.rowcount)
+
+    def copy_expert(self, sql, file, size = 8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            metrics.record_query('postgres', time.perf_counter() - start, lambda: sql.as_string(self) if hasattr(sql, 'as_string') else sql, None, self.rowcount)
 
 def postgres_init(db = 'postgres',user = 'postgres',pw = 'admin',host = 'localhost',port = '5432'):
 
-    conn = psycopg2.connect(database=db, user = user, password = pw, host = host, port = port)
+    conn = psycopg2.connect(database=db, user = user, password = pw, host = host, port = port,
+                            connection_factory=StatementConnection, cursor_factory=TimedCursor)
     return conn
 
-def create_liked_songs_table():
-    conn = postgres_init()
-    cursor = conn.cursor()
-    cursor.execute(open('sql/create_liked_songs.sql').read())
-    conn.commit()
-    cursor.close()
-    conn.close()
-
-def create_recent_songs_table():
-    conn = postgres_init()
-    cursor = conn.cursor()
-    cursor.execute(open('sql/create_recent_songs.sql').read())
-    conn.commit()
-    cursor.close()
-    conn.close()
-
-#Creates an album table and returns it's results
-def create_album_table():
-    conn = postgres_init()
-    cursor = conn.cursor()
-    cursor.execute(open('sql/create_album_table.sql').read())
-    cursor.execute(open('sql/select_all_albums.sql').read())
-    conn.commit()
-    res = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return res
+def pool_init(minconn = POOL_MIN,maxconn = POOL_MAX,db = 'postgres',user = 'postgres',pw = 'admin',host = 'localhost',port = '5432'):
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+        _last_used.clear()
+        _pool = pool.ThreadedConnectionPool(minconn, maxconn, database=db, user=user, password=pw, host=host, port=port,
+                                            connection_factory=StatementConnection, cursor_factory=TimedCursor)
+        _pool_slots = threading.BoundedSemaphore(maxconn)
+    return _pool
 
-def create_artist_table():
-    conn = postgres_init()
-    cursor = conn.cursor()
-    cursor.execute(open('sql/create_artist_table.sql').read())
-    conn.commit()
-    cursor.close()
-    conn.close()    
-
-def select_unique_artists():
-    conn = postgres_init()
-    cursor = conn.cursor()
-    cursor.execute(open('sql/select_unique_artist_ids.sql').read())
-    conn.commit()
-    res = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return res
+def pool_close():
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+        _pool = None
+        _pool_slots = None
+        _last_used.clear()
 
-def check_liked_songs(table):
-    conn = postgres_init()
-    cursor = conn.cursor()
-    cursor.execute('SELECT MAX(added_at) from {}'.format(table))
-    conn.commit()
-    res = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    if res[0] is not None:
-        return res[0],True
-    return None,False
+def pool_stats():
+    with _pool_lock:
+        stats = dict(_pool_metrics)
+    checkouts = stats['checkouts'] or 1
+    stats['wait_seconds_avg'] = stats['wait_seconds_total'] / checkouts
+    stats['checkout_seconds_avg'] = stats['checkout_seconds_total'] / checkouts
+    stats['max_size'] = _pool.maxconn if _pool is not None else 0
+    return stats
 
-def add_liked_songs_dict(songs,table):
-    conn = postgres_init()
-    cursor = conn.cursor()
+def _record(key, value):
+    with _pool_lock:
+        _pool_metrics[key + '_total'] += value
+        _pool_metrics[key + '_max'] = max(_pool_metrics[key + '_max'], value)
 
-    if songs:
-        for i in range(len(songs)):
-            song_name = songs[i]['song_name']
-            song_name = song_name.replace("'","''")
+def _healthy(conn):
+    if conn.closed:
+        return False
+    now = time.monotonic()
+    if now - _last_used.setdefault(id(conn), now) < POOL_CHECK_AFTER:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
-        columns = songs[0].keys()
-        query = "INSERT INTO {} ({}) VALUES %s".format(table,','.join(columns))
-        values = [[value for value in song.values()] for song in songs]
-        execute_values(cursor, query, values)
+def _checkout(conn_pool):
+    while True:
+        conn = conn_pool.getconn()
+        if _healthy(conn):
+            return conn
+        _last_used.pop(id(conn), None)
+        conn_pool.putconn(conn, close=True)
+        with _pool_lock:
+            _pool_metrics['discarded'] += 1
+
+#Checks a connection out of the shared pool and returns it when the block exits
+@contextmanager
+def connection():
+    conn_pool, slots = _pool, _pool_slots
+    if conn_pool is None:
+        with _init_lock:
+            if _pool is None:
+                pool_init()
+        conn_pool, slots = _pool, _pool_slots
+
+    start = time.monotonic()
+    if not slots.acquire(timeout=POOL_TIMEOUT):
+        with _pool_lock:
+            _pool_metrics['timeouts'] += 1
+        raise pool.PoolError('timed out waiting for a database connection')
+    try:
+        conn = _checkout(conn_pool)
+    except Exception:
+        slots.release()
+        raise
+    checked_out = time.monotonic()
+    _record('wait_seconds', checked_out - start)
+    with _pool_lock:
+        _pool_metrics['checkouts'] += 1
+        _pool_metrics['in_use'] += 1
+
+    try:
+        yield conn
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        now = time.monotonic()
+        _record('checkout_seconds', now - checked_out)
+        _last_used[id(conn)] = now
+        with _pool_lock:
+            _pool_metrics['in_use'] -= 1
+        broken = conn.closed or conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+        if broken:
+            _last_used.pop(id(conn), None)
+        if not conn_pool.closed:
+            conn_pool.putconn(conn, close=broken)
+        slots.release()
+
+#Session-level advisory lock, held for the duration of the block when acquired.
+#Yields False straight away if another session already holds it.
+@contextmanager
+def advisory_lock(name):
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(hashtext(%s))', (name,))
+        acquired = cursor.fetchone()[0]
         conn.commit()
+        try:
+            yield acquired
+        finally:
+            if acquired and not conn.closed:
+                cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))', (name,))
+                conn.commit()
 
-    cursor.close()
-    conn.close()
+#Runs a registered statement. The ones in PREPARED go through a server-side
+#prepared statement, so repeated calls skip parsing and planning.
+def _execute(cursor,name,params = None):
+    conn = cursor.connection
+    if not PREPARE or name not in _prepared or not isinstance(conn,StatementConnection):
+        cursor.execute(STATEMENTS[name],params)
+        return
+    prepare,execute = _prepared[name]
+    try:
+        if name not in conn.prepared:
+            cursor.execute(prepare)
+            conn.prepared.add(name)
+        cursor.execute(execute,params)
+    except psycopg2.errors.InvalidSqlStatementName:
+        # The server no longer has it, e.g. after a DISCARD ALL; prepare again.
+        # Only the failed EXECUTE is undone, not the transaction's earlier
+        # statements such as search_library's set_config.
+        cursor.execute('ROLLBACK TO SAVEPOINT prepared_statement')
+        conn.prepared.clear()
+        cursor.execute(prepare)
+        conn.prepared.add(name)
+        cursor.execute(execute,params)
 
-def add_albums_dict(albums):
-    conn = postgres_init()
-    cursor = conn.cursor()
+#Creates the normalized tables and indexes, and moves rows over from the old
+#one-row-per-artist tables the first time it runs against such a database.
+#Users without a search vocabulary get theirs built from the stored names.
+def create_tables():
+    with connection() as conn, conn.cursor() as cursor:
+        _execute(cursor,'migrate_user_columns')
+        _execute(cursor,'create_tables')
+        _execute(cursor,'migrate_legacy_tables')
+        cursor.execute('SELECT user_id from users u where NOT EXISTS (SELECT 1 from search_words w where w.user_id = u.user_id)')
+        for user_id, in cursor.fetchall():
+            _execute(cursor,'refresh_search_words',{'user_id': user_id})
+        conn.commit()
 
-    if albums:
-        for i in range(len(albums)):
-            album_name = albums[i]['album_name']
-            album_name = album_name.replace("'","''")
+#Hands likes and plays stored before data was kept per user to `user_id`;
+#returns how many rows it took over
+def claim_unowned_rows(user_id):
+    with connection() as conn, conn.cursor() as cursor:
+        _execute(cursor,'claim_unowned_rows',{'user_id': user_id})
+        conn.commit()
+        res = cursor.fetchone()[0]
+    return res
 
-        columns = albums[0].keys()
-        query = "INSERT INTO album ({}) VALUES %s".format(','.join(columns))
-        values = [[value for value in album.values()] for album in albums]
+#Users whose libraries are kept; the recents collector polls each of them
+def add_user(user_id):
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute('INSERT INTO users (user_id) VALUES (%s) ON CONFLICT DO NOTHING', (user_id,))
+        conn.commit()
 
-        execute_values(cursor, query, values)
+def select_users():
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute('SELECT user_id from users')
         conn.commit()
+        res = cursor.fetchall()
+    return [row[0] for row in res]
 
-    cursor.close()
-    conn.close()    
+#When the user's library was last walked in full, kept with the user so that
+#every process and restart sees it
+def select_last_full_sync(user_id):
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute('SELECT last_full_sync from users where user_id = %s', (user_id,))
+        conn.commit()
+        res = cursor.fetchone()
+    return res[0] if res else None
 
-def add_artists_dict(artists):
-    conn = postgres_init()
-    cursor = conn.cursor()
+def record_full_sync(user_id,finished_at):
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute('UPDATE users SET last_full_sync = %s where user_id = %s', (finished_at,user_id))
+        conn.commit()
 
-    if artists:
-        for i in range(len(artists)):
-            artist_name = artists[i]['artist_name']
-            artist_name = artist_name.replace("'","''")
+def save_sync_status(user_id,status):
+    columns = storage.SYNC_STATUS_COLUMNS
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute('INSERT INTO sync_status (user_id,{0}) VALUES (%s,{1}) ON CONFLICT (user_id) DO UPDATE SET {2}'.format(
+                           ','.join(columns),','.join(['%s'] * len(columns)),
+                           ','.join('{0} = EXCLUDED.{0}'.format(column) for column in columns)),
+                       [user_id] + [status[column] for column in columns])
+        conn.commit()
 
-        columns = artists[0].keys()
-        query = "INSERT INTO artist ({}) VALUES %s".format(','.join(columns))
-        values = [[value for value in artist.values()] for artist in artists]
+def select_sync_status(user_id):
+    columns = storage.SYNC_STATUS_COLUMNS
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute('SELECT {} from sync_status where user_id = %s'.format(','.join(columns)), (user_id,))
+        conn.commit()
+        res = cursor.fetchone()
+    return dict(zip(columns,res)) if res else None
 
-        execute_values(cursor, query, values)
+#Write counters of the query cache's tables, shared by every process using
+#this database; see cache.share_generations. Names are bumped in sorted order
+#so that two writers never wait on each other's rows.
+def select_cache_generations(names):
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute('SELECT name,generation from cache_generations where name = ANY(%s)', (list(names),))
         conn.commit()
+        res = cursor.fetchall()
+    return dict(res)
 
-    cursor.close()
-    conn.close()        
+def bump_cache_generations(names):
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute('INSERT INTO cache_generations (name,generation) SELECT name,1 from unnest(%s::varchar[]) as name '
+                       'ON CONFLICT (name) DO UPDATE SET generation = cache_generations.generation + 1', (sorted(set(names)),))
+        conn.commit()
 
-def select_unique_albums():
-    conn = postgres_init()
-    cursor = conn.cursor()
-    cursor.execute(open('sql/select_unique_album_ids.sql').read())
-    conn.commit()
-    res = cursor.fetchall()
-    cursor.close()
-    conn.close()
+#Runs a registered read statement and returns its rows
+def fetch(name,params):
+    with connection() as conn, conn.cursor() as cursor:
+        _execute(cursor,name,params)
+        conn.commit()
+        res = cursor.fetchall()
     return res
 
-def select_liked_songs(beg,end = 'all'):
-    conn = postgres_init()
-    cursor = conn.cursor()
-    cursor.execute(open('sql/view_liked_songs.sql').read())
-    conn.commit()
-    res = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    if end == 'all':
-        return res[beg:]
-    return res[beg:end]
-
-def select_recent_songs(beg,end = 'all'):
-    conn = postgres_init()
-    cursor = conn.cursor()
-    cursor.execute(open('sql/view_recents.sql').read())
-    conn.commit()
-    res = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    if end == 'all':
-        return res[beg:]
-    return res[beg:end]
-#Analytics aid functions
+#Newest value of `column` in the user's rows of `fact`, or None
+def select_high_water(fact,column,user_id):
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute(sql.SQL('SELECT MAX({}) from {} where user_id = %s').format(sql.Identifier(column),sql.Identifier(fact)),(user_id,))
+        conn.commit()
+        res = cursor.fetchone()
+    return res[0]
 
-def get_years():
-    conn = postgres_init()
-    cursor = conn.cursor()
-    cursor.execute(open('sql/get_years.sql').read())
-    conn.commit()
-    res = cursor.fetchall()
-    cursor.close()
-    conn.close()
+#Removes the user's liked songs that are not among `song_ids` and returns the
+#(year, month) of each removed like
+def delete_unliked_songs(user_id,song_ids):
+    with connection() as conn, conn.cursor() as cursor:
+        _execute(cursor,'delete_unliked_songs',{'user_id': user_id,'song_ids': list(song_ids)})
+        conn.commit()
+        res = cursor.fetchall()
     return res
 
-def get_albums_for_year(year):
-    conn = postgres_init()
-    cursor = conn.cursor()
-    cursor.execute(open('sql/get_albums.sql').read().format(year))
-    conn.commit()
-    res = cursor.fetchall()
-    cursor.close()
-    conn.close()
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\','\\\\').replace('\t','\\t').replace('\n','\\n').replace('\r','\\r')
+
+#File-like object that renders rows in COPY text format as psycopg2 reads them,
+#so the rows are never held in memory as one big string
+class _CopyStream:
+
+    def __init__(self,rows):
+        self.rows = 0
+        self._lines = self._render(rows)
+        self._buffer = ''
+
+    def _render(self,rows):
+        for row in rows:
+            self.rows += 1
+            yield '\t'.join(_copy_value(value) for value in row) + '\n'
+
+    def read(self,size = -1):
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines,None)
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            size = len(self._buffer)
+        chunk,self._buffer = self._buffer[:size],self._buffer[size:]
+        return chunk
+
+def _bulk_upsert(cursor,table,columns,rows,key = None):
+    key = key or storage.KEYS[table]
+    staging = sql.Identifier('staging_' + table)
+    column_list = sql.SQL(',').join(sql.Identifier(column) for column in columns)
+    key_list = sql.SQL(',').join(sql.Identifier(column) for column in key)
+    updates = [column for column in columns if column not in key]
+    # Rows that would not change are left alone, so the count only covers real changes
+    if updates:
+        on_conflict = sql.SQL('DO UPDATE SET {} WHERE ({}) IS DISTINCT FROM ({})').format(
+            sql.SQL(',').join(sql.SQL('{0} = EXCLUDED.{0}').format(sql.Identifier(column)) for column in updates),
+            sql.SQL(',').join(sql.SQL('{}.{}').format(sql.Identifier(table),sql.Identifier(column)) for column in updates),
+            sql.SQL(',').join(sql.SQL('EXCLUDED.{}').format(sql.Identifier(column)) for column in updates))
+    else:
+        on_conflict = sql.SQL('DO NOTHING')
+
+    cursor.execute(sql.SQL('DROP TABLE IF EXISTS {0}; CREATE TEMP TABLE {0} (LIKE {1} INCLUDING DEFAULTS) ON COMMIT DROP').format(
+        staging,sql.Identifier(table)))
+    cursor.copy_expert(sql.SQL('COPY {} ({}) FROM STDIN').format(staging,column_list),_CopyStream(rows))
+    cursor.execute(sql.SQL('INSERT INTO {table} ({columns}) SELECT DISTINCT ON ({key}) {columns} FROM {staging} '
+                           'ORDER BY {key} ON CONFLICT ({key}) {on_conflict}').format(
+        table=sql.Identifier(table),columns=column_list,key=key_list,staging=staging,on_conflict=on_conflict))
+    return cursor.rowcount
+
+#Streams rows into a temporary staging table with COPY and merges them into
+#`table`, updating rows whose key already exists. Returns the number of rows
+#inserted or updated.
+def bulk_upsert(table,columns,rows,key = None):
+    with connection() as conn, conn.cursor() as cursor:
+        res = _bulk_upsert(cursor,table,columns,rows,key)
+        conn.commit()
     return res
 
-def get_popular_for_year(year,flag):
-    conn = postgres_init()
-    cursor = conn.cursor()
-    final_res = []
-    for month in range(1,13):
-        query = open('sql/get_popular.sql').read()
-        cursor.execute(query.format(year,month,flag))
+#Upserts several tables in one transaction; `batches` maps each table to its
+#(columns, rows). Returns the number of rows changed per table.
+def upsert_tables(batches):
+    with connection() as conn, conn.cursor() as cursor:
+        changed = {table: _bulk_upsert(cursor,table,columns,rows) for table,(columns,rows) in batches.items()}
+        conn.commit()
+    return changed
+
+#Analytics aid functions
+
+#Creates the precomputed analytics tables and reports whether they hold no
+#rows for the user yet
+def create_analytics_tables(user_id):
+    with connection() as conn, conn.cursor() as cursor:
+        _execute(cursor,'create_analytics_tables')
+        cursor.execute('SELECT NOT EXISTS (SELECT 1 from analytics_month where user_id = %(user_id)s) '
+                       'OR NOT EXISTS (SELECT 1 from analytics_artists where user_id = %(user_id)s and source = \'liked\')', {'user_id': user_id})
+        conn.commit()
+        res = cursor.fetchone()
+    return res[0]
+
+def refresh_analytics(user_id,periods = None):
+    with connection() as conn, conn.cursor() as cursor:
+        if periods is None:
+            _execute(cursor,'select_liked_periods',{'user_id': user_id})
+            periods = cursor.fetchall()
+            cursor.execute('DELETE FROM analytics_month where user_id = %(user_id)s; '
+                           'DELETE FROM analytics_year_albums where user_id = %(user_id)s; '
+                           'DELETE FROM analytics_genres where user_id = %(user_id)s and source = \'liked\'; '
+                           'DELETE FROM analytics_artists where user_id = %(user_id)s and source = \'liked\'', {'user_id': user_id})
+        if periods:
+            params = {
+                'user_id': user_id,
+                'years': [int(year) for year,month in periods],
+                'months': [int(month) for year,month in periods],
+            }
+            _execute(cursor,'refresh_analytics',params)
+        conn.commit()
+
+def refresh_play_analytics(user_id,periods = None):
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute('SELECT NOT EXISTS (SELECT 1 from analytics_listening where user_id = %s)', (user_id,))
+        if periods is None or cursor.fetchone()[0]:
+            _execute(cursor,'select_play_periods',{'user_id': user_id})
+            periods = cursor.fetchall()
+            cursor.execute('DELETE FROM analytics_listening where user_id = %(user_id)s; '
+                           'DELETE FROM analytics_genres where user_id = %(user_id)s and source = \'played\'; '
+                           'DELETE FROM analytics_artists where user_id = %(user_id)s and source = \'played\'', {'user_id': user_id})
+        if periods:
+            params = {
+                'user_id': user_id,
+                'years': [int(year) for year,month in periods],
+                'months': [int(month) for year,month in periods],
+            }
+            _execute(cursor,'refresh_play_analytics',params)
+        conn.commit()
+
+def refresh_search_words(user_id,periods = None):
+    with connection() as conn, conn.cursor() as cursor:
+        if periods is None:
+            _execute(cursor,'refresh_search_words',{'user_id': user_id})
+        else:
+            params = {
+                'user_id': user_id,
+                'years': [int(year) for year,month in periods],
+                'months': [int(month) for year,month in periods],
+            }
+            _execute(cursor,'add_search_words',params)
+        conn.commit()
+
+#Search
+
+#tsquery matching names that have a word starting with each term of the
+#search. Terms none of the user's words start with are swapped for their
+#words closest to them, so typos still find the names they were meant for.
+def _search_match(cursor,user_id,terms):
+    corrections = {}
+    _execute(cursor,'search_corrections',{'terms': terms,'user_id': user_id,'corrections': storage.SEARCH_CORRECTIONS})
+    for term,word in cursor.fetchall():
+        corrections.setdefault(term,[]).append(word)
+    return ' & '.join("({})".format(' | '.join("'{}'".format(word) for word in corrections[term])) if term in corrections
+                      else "'{}':*".format(term) for term in terms)
+
+#storage.search_library's rows for the lowercased words of the search
+def match_library(user_id,terms,limit):
+    with connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT set_config('pg_trgm.word_similarity_threshold',%s,true)",(str(storage.SEARCH_SIMILARITY),))
+        match = _search_match(cursor,user_id,terms)
+        _execute(cursor,'search_library',{'match': match,'user_id': user_id,'limit': limit})
         conn.commit()
         res = cursor.fetchall()
-        final_res.extend(res)
-    cursor.close()
-    conn.close()
-    return final_res
\ No newline at end of file
+    return res
+
+metrics.instrument(globals(),'postgres',exclude=('connection','advisory_lock'))
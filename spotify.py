@@ -1,7 +1,15 @@
 import spotipy
-import pandas as pd
 import os
+import requests
+import threading
+import time
+import api_cache
+import fetcher
+import metrics
+from datetime import datetime, timezone
 from dotenv import load_dotenv
+from spotipy.exceptions import SpotifyException, SpotifyOauthError
+from urllib3.util.retry import Retry
 
 
 load_dotenv()
@@ -11,22 +19,140 @@ client_id = os.getenv("CLIENT_ID")
 client_secret = os.getenv("CLIENT_SECRET")
 redirect_uri = 'http://localhost:7777/callback'
 scope = 'user-read-recently-played user-library-read'
+# Point the client at another API root, e.g. the fake server in bench/
+API_PREFIX = os.getenv('SPOTIFY_API_PREFIX')
+# Keep-alive connections kept open to the API, shared by every user and thread
+HTTP_POOL_SIZE = int(os.getenv('SPOTIFY_HTTP_POOL_SIZE', '16'))
+# Access tokens are refreshed this many seconds before they expire
+TOKEN_REFRESH_MARGIN = float(os.getenv('SPOTIFY_TOKEN_REFRESH_MARGIN', '300'))
 
+_http = None
+_sessions = {}
+_sessions_lock = threading.Lock()
 
-#Gets spotify data for recent songs and returns a dictionary
+
+#The one HTTP session behind every client. 5xx responses are retried here as
+#spotipy's own session would; 429s are left to the fetcher module, which
+#honours Retry-After across all workers. urllib3 would otherwise sleep on a
+#429's Retry-After itself, in the one thread that received it.
+def http_session():
+    global _http
+    with _sessions_lock:
+        if _http is None:
+            retry = Retry(total=3, connect=None, read=False, allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+                          status=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504),
+                          respect_retry_after_header=False)
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+            _http = requests.Session()
+            _http.mount('http://', adapter)
+            _http.mount('https://', adapter)
+        return _http
+
+
+#A client on the shared HTTP session. spotipy closes a client's session once
+#the client is garbage collected, which would drop every pooled connection.
+class SharedSpotify(spotipy.Spotify):
+
+    def __del__(self):
+        pass
+
+
+#Hands out a user's token from the .cache-<username> file written when they
+#authorized the app, refreshing it TOKEN_REFRESH_MARGIN seconds before it
+#expires. It never prompts: a user without a cached token raises
+#SpotifyOauthError until they are authorized with `python spotify.py <username>`.
+class SessionAuth(spotipy.SpotifyOAuth):
+
+    def __init__(self, spotify_username):
+        super().__init__(client_id=client_id, client_secret=client_secret, redirect_uri=redirect_uri, scope=scope,
+                         cache_handler=spotipy.CacheFileHandler(username=spotify_username),
+                         requests_session=http_session(), open_browser=False)
+        self.spotify_username = spotify_username
+        self._token = None
+        self._lock = threading.Lock()
+
+    # The session is shared, as for SharedSpotify
+    def __del__(self):
+        pass
+
+    def _expiring(self, token):
+        return token['expires_at'] - time.time() < TOKEN_REFRESH_MARGIN
+
+    def get_access_token(self, code=None, as_dict=True, check_cache=True):
+        with self._lock:
+            if self._token is None or self._expiring(self._token):
+                # Another process may have refreshed the token already
+                cached = self.cache_handler.get_cached_token()
+                if cached is None:
+                    raise SpotifyOauthError('{} has not authorized the app, run `python spotify.py {}` once'
+                                            .format(self.spotify_username, self.spotify_username))
+                self._token = cached
+                if self._expiring(cached):
+                    self._token = self.refresh_access_token(cached['refresh_token'])
+            return self._token if as_dict else self._token['access_token']
+
+
+#The user's client, created on first use and then shared by every sync and
+#thread, so their token and the pooled connections are reused
 def spotify_init(spotify_username):
-    #username = input("Enter your Spotify username ")
-    token = spotipy.util.prompt_for_user_token(username=spotify_username, 
-                                    scope=scope, 
-                                    client_id=client_id,   
-                                    client_secret=client_secret,     
-                                    redirect_uri=redirect_uri)
-    return token
-
-
-def recent_songs(token):
-    sp = spotipy.Spotify(token)
-    user_recent = sp.current_user_recently_played(limit = 50)
+    #Offline runs replay cached responses and need no token
+    if api_cache.OFFLINE:
+        return None
+    with _sessions_lock:
+        sp = _sessions.get(spotify_username)
+    if sp is None:
+        sp = SharedSpotify(auth_manager=SessionAuth(spotify_username), requests_session=http_session())
+        if API_PREFIX:
+            sp.prefix = API_PREFIX
+        with _sessions_lock:
+            sp = _sessions.setdefault(spotify_username, sp)
+    return sp
+
+
+#`token` is a client from spotify_init or a bare access token
+def spotify_client(token):
+    if isinstance(token, spotipy.Spotify):
+        return token
+    sp = SharedSpotify(auth=token, requests_session=http_session())
+    if API_PREFIX:
+        sp.prefix = API_PREFIX
+    return sp
+
+
+#GET through the response cache: the stored ETag is sent as If-None-Match and a
+#304 answers from the cache. spotipy has no way to add request headers, so
+#this goes through its session directly.
+def cached_get(sp,key,path,params):
+    entry = api_cache.get(key) if api_cache.ENABLED else None
+    if api_cache.OFFLINE:
+        if entry is None:
+            raise LookupError('{} is not in the response cache'.format(key))
+        return entry[0]
+
+    headers = sp._auth_headers()
+    if entry is not None and entry[1]:
+        headers['If-None-Match'] = entry[1]
+    response = sp._session.get(sp.prefix + path,params=params,headers=headers,
+                               proxies=sp.proxies,timeout=sp.requests_timeout)
+    if response.status_code == 304 and entry is not None:
+        api_cache.record('not_modified')
+        return entry[0]
+    if response.status_code >= 400:
+        raise SpotifyException(response.status_code,-1,'{}:\n {}'.format(response.url,response.text),
+                               headers=response.headers)
+    body = response.json()
+    if api_cache.ENABLED:
+        api_cache.put(key,body,response.headers.get('ETag'))
+    return body
+
+
+#Responses are cached per `user` when one is given
+def recent_songs(token,user = None):
+    sp = spotify_client(token)
+    if user is None:
+        user_recent = fetcher.call_with_retry(sp.current_user_recently_played,limit = 50)
+    else:
+        user_recent = fetcher.call_with_retry(cached_get,sp,'recently_played:{}:None'.format(user),'me/player/recently-played',{'limit': 50})
     for i in user_recent['items']:
         i['added_at'] = i['played_at']
     '''
@@ -42,100 +168,158 @@ def recent_songs(token):
     '''
     return user_recent['items']
 
-def get_liked_songs(token):
-    sp = spotipy.Spotify(token)
+#Plays after `after` (a datetime, normally the newest play already stored),
+#oldest page first, following the `after` cursor until there are no newer
+#plays. Without `after` only the latest 50 plays are available. With a `user`
+#the request is revalidated against the response cache, so an unchanged
+#history costs a 304. Each cursor is its own cache entry.
+def recent_song_pages(token,after = None,user = None):
+    sp = spotify_client(token)
+    params = {'limit': 50}
+    if after is not None:
+        params['after'] = int(after.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    while True:
+        if user is None:
+            user_recent = fetcher.call_with_retry(sp.current_user_recently_played,**params)
+        else:
+            user_recent = fetcher.call_with_retry(cached_get,sp,'recently_played:{}:{}'.format(user,params.get('after')),'me/player/recently-played',params)
+        for i in user_recent['items']:
+            i['added_at'] = i['played_at']
+        yield user_recent['items']
+        if after is None or user_recent['next'] is None or not user_recent['cursors']:
+            return
+        params = {'limit': 50,'after': user_recent['cursors']['after']}
+
+#Saved tracks come back newest first, so when `since` (the newest added_at
+#already stored) is given, paging stops at the first track that is not newer.
+#Without it the first page gives the total and the rest are fetched in parallel.
+#Yields one page of items at a time.
+def liked_song_pages(token,since = None,workers = None,user = None):
+    sp = spotify_client(token)
     lim = 50
-    off =  0
-    songs = []
-    next = 'not none'
-    while next is not None:
-        liked_songs = sp.current_user_saved_tracks(offset=off,limit=lim)
+
+    def page(off):
+        if user is not None:
+            return cached_get(sp,'saved_tracks:{}:{}:{}'.format(user,off,lim),'me/tracks',{'offset': off,'limit': lim})
+        return sp.current_user_saved_tracks(offset=off,limit=lim)
+
+    liked_songs = fetcher.call_with_retry(page,0)
+    if since is None:
+        yield liked_songs['items']
+        for liked_songs in fetcher.fetch_ordered(page,range(lim,liked_songs['total'],lim),workers):
+            yield liked_songs['items']
+        return
+
+    off = 0
+    while True:
+        items = []
         for i in liked_songs['items']:
-            songs.append(i)
+            if parse_added_at(i['added_at']) <= since:
+                yield items
+                return
+            items.append(i)
+        yield items
+        if liked_songs['next'] is None:
+            return
         off = off + lim
-        next = liked_songs['next']
-    return songs
+        liked_songs = fetcher.call_with_retry(page,off)
 
-def get_albums(token,album_ids):
-    sp = spotipy.Spotify(token)
-    albums = []
-    number_of_ids = len(album_ids)
-    #print(number_of_ids)
-    if album_ids:
-        #print(sp.albums(album_ids[0:2]))
-        for i in range(int(number_of_ids/20)):
-            albums.extend(sp.albums(album_ids[20*i:20*i+20])['albums'])
-        albums.extend(sp.albums(album_ids[int(number_of_ids/20)*20:])['albums'])
-
-    return albums
-
-def get_artists(token,artist_ids):
-    sp = spotipy.Spotify(token)
-    artists = []
-    number_of_ids = len(artist_ids)
-    if artist_ids:
-        #print(sp.albums(album_ids[0:2]))
-        for i in range(int(number_of_ids/50)):
-            artists.extend(sp.artists(artist_ids[50*i:50*i+50])['artists'])
-        artists.extend(sp.artists(artist_ids[int(number_of_ids/50)*50:])['artists'])
-
-    return artists
-
-
-def process_liked_songs(liked_songs):
-    number_of_songs = len(liked_songs)
-    songs_dict = []
-    for i in range(number_of_songs):
-        temp_dict = {}
-        temp_dict['song_id'] = liked_songs[i]['track']['id']
-        temp_dict['song_name'] = liked_songs[i]['track']['name']
-        temp_dict['added_at'] = liked_songs[i]['added_at']
-        temp_dict['album'] = liked_songs[i]['track']['album']['id']
-        temp_dict['popularity'] = liked_songs[i]['track']['popularity']
-        temp_dict['preview_url'] = liked_songs[i]['track']['preview_url']
-        temp_dict['duration_ms'] = liked_songs[i]['track']['duration_ms']
+def get_liked_songs(token,since = None,workers = None,user = None):
+    return [i for items in liked_song_pages(token,since,workers,user) for i in items]
 
-        for artist in liked_songs[i]['track']['artists']:
-            temp_dict['artists'] = artist['id']
-            songs_dict.append(temp_dict.copy())
+def parse_added_at(timestamp):
+    return datetime.fromisoformat(timestamp[:-1])
 
-    return songs_dict
+#Yields albums or artists for the given ids one batch at a time: first the
+#ones in the response cache, then the rest fetched `size` ids per request
+def _entity_batches(func,kind,ids,size,workers):
+    missing = []
+    for i in range(0,len(ids),500):
+        chunk = ids[i:i+500]
+        cached = api_cache.get_entities(kind,chunk)
+        if cached:
+            yield list(cached.values())
+        missing.extend(j for j in chunk if j not in cached)
+    if api_cache.OFFLINE or not missing:
+        return
 
+    batches = (missing[i:i+size] for i in range(0,len(missing),size))
+    for res in fetcher.fetch_ordered(func,batches,workers):
+        api_cache.put_entities(kind,res[kind])
+        yield res[kind]
 
-def process_albums(albums):
-    number_of_songs = len(albums)
-    album_dict = []
-    for i in range(number_of_songs):
-        temp_dict = {}
-        temp_dict['album_id'] = albums[i]['id']
-        temp_dict['album_name'] = albums[i]['name']
-        temp_dict['popularity'] = albums[i]['popularity']
-
-        for genre in albums[i]['genres']:
-            temp_dict['genres'] = genre
-            album_dict.append(temp_dict.copy())
-        if not albums[i]['genres']:
-            temp_dict['genres'] = 'N.A'
-        for artist in albums[i]['artists']:
-            temp_dict['artists'] = artist['id']
-            album_dict.append(temp_dict.copy())
-
-    return album_dict
-
-def process_artists(artists):
-    number_of_songs = len(artists)
-    artist_dict = []
-    for i in range(number_of_songs):
-        temp_dict = {}
-        temp_dict['artist_id'] = artists[i]['id']
-        temp_dict['artist_name'] = artists[i]['name']
-        temp_dict['popularity'] = artists[i]['popularity']
-        temp_dict['followers'] = artists[i]['popularity']
-
-        for genre in artists[i]['genres']:
-            temp_dict['genres'] = genre
-            artist_dict.append(temp_dict.copy())
-        if not artists[i]['genres']:
-            temp_dict['genres'] = 'N.A'
-
-    return artist_dict
\ No newline at end of file
+def album_batches(token,album_ids,workers = None):
+    sp = spotify_client(token)
+    return _entity_batches(sp.albums,'albums',album_ids,20,workers)
+
+def artist_batches(token,artist_ids,workers = None):
+    sp = spotify_client(token)
+    return _entity_batches(sp.artists,'artists',artist_ids,50,workers)
+
+def get_albums(token,album_ids,workers = None):
+    return [album for albums in album_batches(token,album_ids,workers) for album in albums]
+
+def get_artists(token,artist_ids,workers = None):
+    return [artist for artists in artist_batches(token,artist_ids,workers) for artist in artists]
+
+
+#Column-wise transforms: each returns a dict of equal-length lists, one per
+#column, built with a pass per column instead of a dict per record, ready to be
+#zipped into rows by the storage backend.
+
+#Saved tracks or plays as columns, the artist ids of each track kept as a list
+#in credit order and added_at parsed to datetimes. With `after`, only items
+#added after it are kept. Local files and unavailable tracks have no id and
+#are skipped.
+def track_columns(items,after = None):
+    items = [i for i in items if i['track'] is not None and i['track']['id'] is not None]
+    added_at = [datetime.fromisoformat(i['added_at'][:-1]) for i in items]
+    if after is not None:
+        keep = [n for n,added in enumerate(added_at) if added > after]
+        if len(keep) < len(items):
+            items = [items[n] for n in keep]
+            added_at = [added_at[n] for n in keep]
+    tracks = [i['track'] for i in items]
+    return {
+        'song_id': [track['id'] for track in tracks],
+        'song_name': [track['name'] for track in tracks],
+        'added_at': added_at,
+        'album': [track['album']['id'] for track in tracks],
+        'popularity': [track['popularity'] for track in tracks],
+        'preview_url': [track['preview_url'] for track in tracks],
+        'duration_ms': [track['duration_ms'] for track in tracks],
+        'artists': [[artist['id'] for artist in track['artists'] if artist['id'] is not None] for track in tracks],
+    }
+
+#Albums as columns; artists and genres are a list per album
+def album_columns(albums):
+    albums = [album for album in albums if album is not None]
+    return {
+        'album_id': [album['id'] for album in albums],
+        'album_name': [album['name'] for album in albums],
+        'popularity': [album['popularity'] for album in albums],
+        'genres': [album['genres'] for album in albums],
+        'artists': [[artist['id'] for artist in album['artists']] for album in albums],
+    }
+
+#Artists as columns; genres are a list per artist
+def artist_columns(artists):
+    artists = [artist for artist in artists if artist is not None]
+    return {
+        'artist_id': [artist['id'] for artist in artists],
+        'artist_name': [artist['name'] for artist in artists],
+        'popularity': [artist['popularity'] for artist in artists],
+        'followers': [artist['followers']['total'] for artist in artists],
+        'genres': [artist['genres'] for artist in artists],
+    }
+
+
+metrics.instrument(globals(),'spotify',exclude=('http_session',))
+
+
+#Authorizes a user in the browser and caches their token for spotify_init:
+#    python spotify.py <username>
+if __name__ == '__main__':
+    import sys
+    spotipy.util.prompt_for_user_token(username=sys.argv[1], scope=scope, client_id=client_id,
+                                       client_secret=client_secret, redirect_uri=redirect_uri)
@@ -0,0 +1,22 @@
+-- Adds the words of the user's tracks liked or played in the given (year,
+-- month) pairs, and of those tracks' albums and artists, to their search
+-- vocabulary
+with periods as
+(select distinct year,month from unnest(%(years)s::int[],%(months)s::int[]) as p(year,month)),
+
+user_tracks as
+(select lt.track_id from periods p
+join liked_tracks lt on lt.user_id = %(user_id)s and lt.added_at >= make_date(p.year,p.month,1) and lt.added_at < make_date(p.year,p.month,1) + interval '1 month'
+union select rp.track_id from periods p
+join recent_plays rp on rp.user_id = %(user_id)s and rp.played_at >= make_date(p.year,p.month,1) and rp.played_at < make_date(p.year,p.month,1) + interval '1 month'),
+
+names as
+(select t.track_name as name from user_tracks u join tracks t on t.track_id = u.track_id
+union all select al.album_name from albums al
+where al.album_id in (select t.album_id from user_tracks u join tracks t on t.track_id = u.track_id)
+union all select ar.artist_name from artists ar
+where ar.artist_id in (select ta.artist_id from user_tracks u join track_artists ta on ta.track_id = u.track_id))
+
+insert into search_words (user_id,word)
+select distinct %(user_id)s,v.lexeme from names n,unnest(to_tsvector('simple',n.name)) v
+on conflict do nothing
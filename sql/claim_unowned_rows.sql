@@ -0,0 +1,7 @@
+with liked as
+(update liked_tracks set user_id = %(user_id)s where user_id = '' returning 1),
+
+played as
+(update recent_plays set user_id = %(user_id)s where user_id = '' returning 1)
+
+select (select count(*) from liked) + (select count(*) from played)
@@ -0,0 +1 @@
+SELECT count(*) from recent_plays where user_id = %(user_id)s
\ No newline at end of file
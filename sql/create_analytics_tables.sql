@@ -0,0 +1,25 @@
+CREATE TABLE IF NOT EXISTS analytics_month
+(user_id character varying,year integer,month integer,songs_count integer,duration_ms bigint,
+most_popular_song character varying,most_popular_album character varying,most_popularity integer,
+least_popular_song character varying,least_popular_album character varying,least_popularity integer,
+PRIMARY KEY(user_id,year,month));
+
+CREATE TABLE IF NOT EXISTS analytics_year_albums
+(user_id character varying,year integer,rank integer,album_name character varying,songs_count integer,PRIMARY KEY(user_id,year,rank));
+
+-- Likes ('liked') and plays ('played') per genre of the track's artists and month
+CREATE TABLE IF NOT EXISTS analytics_genres
+(user_id character varying,source character varying,year integer,month integer,genre character varying,songs_count integer,duration_ms bigint,
+PRIMARY KEY(user_id,source,year,month,genre));
+
+-- Likes and plays per credited artist and year
+CREATE TABLE IF NOT EXISTS analytics_artists
+(user_id character varying,source character varying,year integer,artist_id character varying,songs_count integer,duration_ms bigint,
+PRIMARY KEY(user_id,source,year,artist_id));
+
+CREATE INDEX IF NOT EXISTS analytics_artists_top_idx ON analytics_artists (user_id,source,year,songs_count desc);
+
+-- Plays and listening time per month and hour of day (UTC)
+CREATE TABLE IF NOT EXISTS analytics_listening
+(user_id character varying,year integer,month integer,hour integer,plays integer,duration_ms bigint,
+PRIMARY KEY(user_id,year,month,hour));
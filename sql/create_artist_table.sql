@@ -1,3 +0,0 @@
-CREATE TABLE IF NOT EXISTS artist
-(artist_id character varying ,artist_name character varying,popularity integer, followers integer, genres character varying, PRIMARY KEY(artist_id,genres));
-
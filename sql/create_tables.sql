@@ -0,0 +1,56 @@
+CREATE TABLE IF NOT EXISTS users
+(user_id character varying PRIMARY KEY,last_full_sync timestamp);
+ALTER TABLE users ADD COLUMN IF NOT EXISTS last_full_sync timestamp;
+
+CREATE TABLE IF NOT EXISTS sync_status
+(user_id character varying PRIMARY KEY,state character varying,stage character varying,progress double precision,
+queued_at timestamp,started_at timestamp,finished_at timestamp,error character varying);
+
+CREATE TABLE IF NOT EXISTS cache_generations
+(name character varying PRIMARY KEY,generation bigint NOT NULL);
+
+CREATE TABLE IF NOT EXISTS tracks
+(track_id character varying PRIMARY KEY,track_name character varying,album_id character varying,popularity integer,preview_url character varying,duration_ms integer);
+
+CREATE TABLE IF NOT EXISTS track_artists
+(track_id character varying,artist_id character varying,position integer,PRIMARY KEY(track_id,artist_id));
+
+CREATE TABLE IF NOT EXISTS liked_tracks
+(user_id character varying,track_id character varying,added_at timestamp,PRIMARY KEY(user_id,track_id));
+
+CREATE TABLE IF NOT EXISTS recent_plays
+(user_id character varying,track_id character varying,played_at timestamp,PRIMARY KEY(user_id,track_id,played_at));
+
+CREATE TABLE IF NOT EXISTS albums
+(album_id character varying PRIMARY KEY,album_name character varying,popularity integer);
+
+CREATE TABLE IF NOT EXISTS album_artists
+(album_id character varying,artist_id character varying,position integer,PRIMARY KEY(album_id,artist_id));
+
+CREATE TABLE IF NOT EXISTS album_genres
+(album_id character varying,genre character varying,PRIMARY KEY(album_id,genre));
+
+CREATE TABLE IF NOT EXISTS artists
+(artist_id character varying PRIMARY KEY,artist_name character varying,popularity integer,followers integer);
+
+CREATE TABLE IF NOT EXISTS artist_genres
+(artist_id character varying,genre character varying,PRIMARY KEY(artist_id,genre));
+
+CREATE INDEX IF NOT EXISTS liked_tracks_user_added_at_idx ON liked_tracks (user_id,added_at desc,track_id desc);
+CREATE INDEX IF NOT EXISTS recent_plays_user_played_at_idx ON recent_plays (user_id,played_at desc,track_id desc);
+CREATE INDEX IF NOT EXISTS tracks_album_id_idx ON tracks (album_id);
+CREATE INDEX IF NOT EXISTS track_artists_artist_id_idx ON track_artists (artist_id);
+CREATE INDEX IF NOT EXISTS album_artists_artist_id_idx ON album_artists (artist_id);
+CREATE INDEX IF NOT EXISTS album_genres_genre_idx ON album_genres (genre);
+CREATE INDEX IF NOT EXISTS artist_genres_genre_idx ON artist_genres (genre);
+
+-- Each user's search vocabulary. Words compare byte-wise so the primary key
+-- finds the words starting with a prefix as one range.
+CREATE TABLE IF NOT EXISTS search_words
+(user_id character varying,word character varying COLLATE "C",PRIMARY KEY(user_id,word));
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS search_words_trgm_idx ON search_words USING gin (word gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS tracks_name_fts_idx ON tracks USING gin (to_tsvector('simple',track_name));
+CREATE INDEX IF NOT EXISTS albums_name_fts_idx ON albums USING gin (to_tsvector('simple',album_name));
+CREATE INDEX IF NOT EXISTS artists_name_fts_idx ON artists USING gin (to_tsvector('simple',artist_name));
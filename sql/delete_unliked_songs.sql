@@ -0,0 +1,2 @@
+delete from liked_tracks where user_id = %(user_id)s and not (track_id = any(%(song_ids)s::varchar[]))
+returning date_part('YEAR',added_at) as year,date_part('MONTH',added_at) as month
@@ -0,0 +1,3 @@
+select month,genre,songs_count,duration_ms from analytics_genres
+where user_id = %(user_id)s and source = %(source)s and year = %(year)s
+order by month,songs_count desc,genre
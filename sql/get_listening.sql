@@ -0,0 +1,3 @@
+select month,hour,plays,duration_ms from analytics_listening
+where user_id = %(user_id)s and year = %(year)s
+order by month,hour
@@ -0,0 +1,5 @@
+select 'month' as kind,month,most_popular_song,most_popular_album,most_popularity,least_popular_song,least_popular_album,least_popularity,songs_count,duration_ms
+from analytics_month where user_id = %(user_id)s and year = %(year)s
+union all
+select 'album',rank,null,album_name,songs_count,null,null,null,null,null
+from analytics_year_albums where user_id = %(user_id)s and year = %(year)s
@@ -1 +1 @@
-SELECT distinct EXTRACT('year' from added_at) as years from liked_songs order by years
\ No newline at end of file
+SELECT distinct year as years from analytics_month where user_id = %(user_id)s order by years
\ No newline at end of file
@@ -0,0 +1,51 @@
+-- Copies rows from the pre-normalization tables (one row per track/artist and
+-- album/artist/genre pair) into the normalized tables, then renames the old
+-- tables to *_legacy so this only runs once. Likes and plays are stored
+-- with an empty user_id until a user claims them.
+DO $$
+BEGIN
+
+IF to_regclass('liked_songs') IS NOT NULL THEN
+    INSERT INTO tracks (track_id,track_name,album_id,popularity,preview_url,duration_ms)
+    SELECT DISTINCT ON (song_id) song_id,song_name,album,popularity,preview_url,duration_ms FROM liked_songs
+    ORDER BY song_id,added_at desc ON CONFLICT DO NOTHING;
+    INSERT INTO track_artists (track_id,artist_id,position)
+    SELECT song_id,artists,row_number() over (partition by song_id order by artists) - 1 FROM (SELECT DISTINCT song_id,artists FROM liked_songs) ls
+    ON CONFLICT DO NOTHING;
+    INSERT INTO liked_tracks (user_id,track_id,added_at)
+    SELECT '',song_id,max(added_at) FROM liked_songs GROUP BY song_id ON CONFLICT DO NOTHING;
+    ALTER TABLE liked_songs RENAME TO liked_songs_legacy;
+END IF;
+
+IF to_regclass('recents') IS NOT NULL THEN
+    INSERT INTO tracks (track_id,track_name,album_id,popularity,preview_url,duration_ms)
+    SELECT DISTINCT ON (song_id) song_id,song_name,album,popularity,preview_url,duration_ms FROM recents
+    ORDER BY song_id,added_at desc ON CONFLICT DO NOTHING;
+    INSERT INTO track_artists (track_id,artist_id,position)
+    SELECT song_id,artists,row_number() over (partition by song_id order by artists) - 1 FROM (SELECT DISTINCT song_id,artists FROM recents) r
+    ON CONFLICT DO NOTHING;
+    INSERT INTO recent_plays (user_id,track_id,played_at)
+    SELECT DISTINCT '',song_id,added_at FROM recents ON CONFLICT DO NOTHING;
+    ALTER TABLE recents RENAME TO recents_legacy;
+END IF;
+
+IF to_regclass('album') IS NOT NULL THEN
+    INSERT INTO albums (album_id,album_name,popularity)
+    SELECT DISTINCT ON (album_id) album_id,album_name,popularity FROM album ORDER BY album_id ON CONFLICT DO NOTHING;
+    INSERT INTO album_artists (album_id,artist_id,position)
+    SELECT album_id,artists,row_number() over (partition by album_id order by artists) - 1
+    FROM (SELECT DISTINCT album_id,artists FROM album WHERE artists IS NOT NULL) a ON CONFLICT DO NOTHING;
+    INSERT INTO album_genres (album_id,genre)
+    SELECT DISTINCT album_id,genres FROM album WHERE genres IS NOT NULL AND genres <> 'N.A' ON CONFLICT DO NOTHING;
+    ALTER TABLE album RENAME TO album_legacy;
+END IF;
+
+IF to_regclass('artist') IS NOT NULL THEN
+    INSERT INTO artists (artist_id,artist_name,popularity,followers)
+    SELECT DISTINCT ON (artist_id) artist_id,artist_name,popularity,followers FROM artist ORDER BY artist_id ON CONFLICT DO NOTHING;
+    INSERT INTO artist_genres (artist_id,genre)
+    SELECT DISTINCT artist_id,genres FROM artist WHERE genres IS NOT NULL AND genres <> 'N.A' ON CONFLICT DO NOTHING;
+    ALTER TABLE artist RENAME TO artist_legacy;
+END IF;
+
+END $$;
@@ -0,0 +1,37 @@
+-- Adds user_id to likes and plays stored before the data was kept per user.
+-- Existing rows get an empty user_id until a user claims them; the analytics
+-- tables and the search vocabulary only hold derived rows and are dropped to
+-- be rebuilt per user.
+DO $$
+BEGIN
+
+IF to_regclass('liked_tracks') IS NOT NULL AND NOT EXISTS
+(SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = 'liked_tracks' AND column_name = 'user_id') THEN
+    ALTER TABLE liked_tracks ADD COLUMN user_id character varying NOT NULL DEFAULT '';
+    ALTER TABLE liked_tracks ALTER COLUMN user_id DROP DEFAULT;
+    ALTER TABLE liked_tracks DROP CONSTRAINT liked_tracks_pkey;
+    ALTER TABLE liked_tracks ADD PRIMARY KEY (user_id,track_id);
+    DROP INDEX IF EXISTS liked_tracks_added_at_idx;
+END IF;
+
+IF to_regclass('recent_plays') IS NOT NULL AND NOT EXISTS
+(SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = 'recent_plays' AND column_name = 'user_id') THEN
+    ALTER TABLE recent_plays ADD COLUMN user_id character varying NOT NULL DEFAULT '';
+    ALTER TABLE recent_plays ALTER COLUMN user_id DROP DEFAULT;
+    ALTER TABLE recent_plays DROP CONSTRAINT recent_plays_pkey;
+    ALTER TABLE recent_plays ADD PRIMARY KEY (user_id,track_id,played_at);
+    DROP INDEX IF EXISTS recent_plays_played_at_idx;
+END IF;
+
+IF to_regclass('analytics_month') IS NOT NULL AND NOT EXISTS
+(SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = 'analytics_month' AND column_name = 'user_id') THEN
+    DROP TABLE analytics_month;
+    DROP TABLE IF EXISTS analytics_year_albums;
+END IF;
+
+IF to_regclass('search_words') IS NOT NULL AND NOT EXISTS
+(SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = 'search_words' AND column_name = 'user_id') THEN
+    DROP TABLE search_words;
+END IF;
+
+END $$;
@@ -0,0 +1,67 @@
+delete from analytics_month where user_id = %(user_id)s and (year,month) in (select * from unnest(%(years)s::int[],%(months)s::int[]));
+
+insert into analytics_month
+with periods as
+(select distinct year,month from unnest(%(years)s::int[],%(months)s::int[]) as p(year,month)),
+
+liked as
+(select p.year,p.month,t.track_name,al.album_name,t.popularity,t.duration_ms from periods p
+join liked_tracks lt on lt.user_id = %(user_id)s and lt.added_at >= make_date(p.year,p.month,1) and lt.added_at < make_date(p.year,p.month,1) + interval '1 month'
+join tracks t on t.track_id = lt.track_id
+left join albums al on al.album_id = t.album_id),
+
+ranked as
+(select *,
+row_number() over (partition by year,month order by popularity desc nulls last,track_name) as most_rank,
+row_number() over (partition by year,month order by popularity asc nulls last,track_name) as least_rank
+from liked)
+
+select %(user_id)s,year,month,count(*),sum(duration_ms),
+max(track_name) filter (where most_rank = 1),max(album_name) filter (where most_rank = 1),max(popularity) filter (where most_rank = 1),
+max(track_name) filter (where least_rank = 1),max(album_name) filter (where least_rank = 1),max(popularity) filter (where least_rank = 1)
+from ranked group by year,month;
+
+delete from analytics_year_albums where user_id = %(user_id)s and year in (select unnest(%(years)s::int[]));
+
+insert into analytics_year_albums
+with years as
+(select distinct unnest(%(years)s::int[]) as year),
+
+liked as
+(select y.year,al.album_name from years y
+join liked_tracks lt on lt.user_id = %(user_id)s and lt.added_at >= make_date(y.year,1,1) and lt.added_at < make_date(y.year + 1,1,1)
+join tracks t on t.track_id = lt.track_id
+join albums al on al.album_id = t.album_id),
+
+ranked as
+(select year,row_number() over (partition by year order by count(*) desc,album_name desc) as rank,album_name,count(*) as songs_count
+from liked group by year,album_name)
+
+select %(user_id)s,year,rank,album_name,songs_count from ranked where rank <= 3;
+
+delete from analytics_genres where user_id = %(user_id)s and source = 'liked' and (year,month) in (select * from unnest(%(years)s::int[],%(months)s::int[]));
+
+insert into analytics_genres
+with periods as
+(select distinct year,month from unnest(%(years)s::int[],%(months)s::int[]) as p(year,month)),
+
+genres as
+(select distinct p.year,p.month,lt.track_id,t.duration_ms,ag.genre from periods p
+join liked_tracks lt on lt.user_id = %(user_id)s and lt.added_at >= make_date(p.year,p.month,1) and lt.added_at < make_date(p.year,p.month,1) + interval '1 month'
+join tracks t on t.track_id = lt.track_id
+join track_artists ta on ta.track_id = lt.track_id
+join artist_genres ag on ag.artist_id = ta.artist_id)
+
+select %(user_id)s,'liked',year,month,genre,count(*),sum(duration_ms) from genres group by year,month,genre;
+
+delete from analytics_artists where user_id = %(user_id)s and source = 'liked' and year in (select unnest(%(years)s::int[]));
+
+insert into analytics_artists
+with years as
+(select distinct unnest(%(years)s::int[]) as year)
+
+select %(user_id)s,'liked',y.year,ta.artist_id,count(*),sum(t.duration_ms) from years y
+join liked_tracks lt on lt.user_id = %(user_id)s and lt.added_at >= make_date(y.year,1,1) and lt.added_at < make_date(y.year + 1,1,1)
+join tracks t on t.track_id = lt.track_id
+join track_artists ta on ta.track_id = lt.track_id
+group by y.year,ta.artist_id;
@@ -0,0 +1,37 @@
+delete from analytics_listening where user_id = %(user_id)s and (year,month) in (select * from unnest(%(years)s::int[],%(months)s::int[]));
+
+insert into analytics_listening
+with periods as
+(select distinct year,month from unnest(%(years)s::int[],%(months)s::int[]) as p(year,month))
+
+select %(user_id)s,p.year,p.month,extract(hour from rp.played_at)::int,count(*),coalesce(sum(t.duration_ms),0) from periods p
+join recent_plays rp on rp.user_id = %(user_id)s and rp.played_at >= make_date(p.year,p.month,1) and rp.played_at < make_date(p.year,p.month,1) + interval '1 month'
+left join tracks t on t.track_id = rp.track_id
+group by p.year,p.month,extract(hour from rp.played_at)::int;
+
+delete from analytics_genres where user_id = %(user_id)s and source = 'played' and (year,month) in (select * from unnest(%(years)s::int[],%(months)s::int[]));
+
+insert into analytics_genres
+with periods as
+(select distinct year,month from unnest(%(years)s::int[],%(months)s::int[]) as p(year,month)),
+
+genres as
+(select distinct p.year,p.month,rp.track_id,rp.played_at,t.duration_ms,ag.genre from periods p
+join recent_plays rp on rp.user_id = %(user_id)s and rp.played_at >= make_date(p.year,p.month,1) and rp.played_at < make_date(p.year,p.month,1) + interval '1 month'
+join tracks t on t.track_id = rp.track_id
+join track_artists ta on ta.track_id = rp.track_id
+join artist_genres ag on ag.artist_id = ta.artist_id)
+
+select %(user_id)s,'played',year,month,genre,count(*),sum(duration_ms) from genres group by year,month,genre;
+
+delete from analytics_artists where user_id = %(user_id)s and source = 'played' and year in (select unnest(%(years)s::int[]));
+
+insert into analytics_artists
+with years as
+(select distinct unnest(%(years)s::int[]) as year)
+
+select %(user_id)s,'played',y.year,ta.artist_id,count(*),sum(t.duration_ms) from years y
+join recent_plays rp on rp.user_id = %(user_id)s and rp.played_at >= make_date(y.year,1,1) and rp.played_at < make_date(y.year + 1,1,1)
+join tracks t on t.track_id = rp.track_id
+join track_artists ta on ta.track_id = rp.track_id
+group by y.year,ta.artist_id;
@@ -0,0 +1,22 @@
+-- Rebuilds the user's search vocabulary from the names of their liked and
+-- played tracks and of those tracks' albums and artists, split into words
+-- the way the name indexes are, without stemming
+with user_tracks as
+(select track_id from liked_tracks where user_id = %(user_id)s
+union select track_id from recent_plays where user_id = %(user_id)s),
+
+names as
+(select t.track_name as name from user_tracks u join tracks t on t.track_id = u.track_id
+union all select al.album_name from albums al
+where al.album_id in (select t.album_id from user_tracks u join tracks t on t.track_id = u.track_id)
+union all select ar.artist_name from artists ar
+where ar.artist_id in (select ta.artist_id from user_tracks u join track_artists ta on ta.track_id = u.track_id)),
+
+words as
+(select distinct v.lexeme as word from names n,unnest(to_tsvector('simple',n.name)) v),
+
+stale as
+(delete from search_words s where s.user_id = %(user_id)s and not exists (select 1 from words w where w.word = s.word))
+
+insert into search_words (user_id,word) select %(user_id)s,word from words
+on conflict do nothing
@@ -0,0 +1,12 @@
+select t.term,w.word from unnest(%(terms)s) as t(term)
+
+cross join lateral
+(select word from search_words
+where user_id = %(user_id)s and t.term <%% word
+order by word_similarity(t.term,word) desc,word limit %(corrections)s) w
+
+-- Only terms none of the user's words start with are corrected. The first
+-- word at or after the term is one of those if there are any.
+where not exists (select 1 from
+(select p.word from search_words p where p.user_id = %(user_id)s and p.word >= t.term order by p.word limit 1) p
+where starts_with(p.word,t.term))
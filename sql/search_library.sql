@@ -0,0 +1,43 @@
+with by_track as
+
+(select m.track_id,3 as weight,m.popularity from
+(select t.track_id,t.popularity from tracks t
+where to_tsvector('simple',t.track_name) @@ to_tsquery('simple',%(match)s)
+order by t.popularity desc nulls last,t.track_id offset 0) m
+where coalesce((select true from liked_tracks lt where lt.user_id = %(user_id)s and lt.track_id = m.track_id),
+(select true from recent_plays rp where rp.user_id = %(user_id)s and rp.track_id = m.track_id limit 1))
+limit %(limit)s),
+
+by_album as
+
+(select m.track_id,2 as weight,m.popularity from
+(select t.track_id,t.popularity from albums al join tracks t on t.album_id = al.album_id
+where to_tsvector('simple',al.album_name) @@ to_tsquery('simple',%(match)s)
+order by t.popularity desc nulls last,t.track_id offset 0) m
+where coalesce((select true from liked_tracks lt where lt.user_id = %(user_id)s and lt.track_id = m.track_id),
+(select true from recent_plays rp where rp.user_id = %(user_id)s and rp.track_id = m.track_id limit 1))
+limit %(limit)s),
+
+by_artist as
+
+(select m.track_id,1 as weight,m.popularity from
+(select t.track_id,t.popularity from artists ar join track_artists ta on ta.artist_id = ar.artist_id join tracks t on t.track_id = ta.track_id
+where to_tsvector('simple',ar.artist_name) @@ to_tsquery('simple',%(match)s)
+order by t.popularity desc nulls last,t.track_id offset 0) m
+where coalesce((select true from liked_tracks lt where lt.user_id = %(user_id)s and lt.track_id = m.track_id),
+(select true from recent_plays rp where rp.user_id = %(user_id)s and rp.track_id = m.track_id limit 1))
+limit %(limit)s),
+
+library as
+
+(select track_id,max(weight) as weight,max(popularity) as popularity from
+(select * from by_track union all select * from by_album union all select * from by_artist) m
+group by track_id order by weight desc,popularity desc nulls last,track_id limit %(limit)s)
+
+select t.track_id,t.track_name,al.album_name,
+(select string_agg(ar.artist_name,',' order by ta.position) from track_artists ta,artists ar
+where ta.track_id = t.track_id and ar.artist_id = ta.artist_id) as artists,
+t.popularity,t.preview_url,lt.added_at
+from library l join tracks t on t.track_id = l.track_id left join albums al on al.album_id = t.album_id
+left join liked_tracks lt on lt.user_id = %(user_id)s and lt.track_id = l.track_id
+order by l.weight desc,l.popularity desc nulls last,l.track_id
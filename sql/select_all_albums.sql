@@ -1 +0,0 @@
-SELECT * from album
\ No newline at end of file
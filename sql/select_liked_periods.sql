@@ -0,0 +1 @@
+SELECT distinct date_part('YEAR',added_at) as year,date_part('MONTH',added_at) as month from liked_tracks where user_id = %(user_id)s
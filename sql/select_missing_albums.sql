@@ -0,0 +1,3 @@
+-- Referenced album ids that have no row in albums yet
+select distinct ids.id from unnest(%(ids)s::varchar[]) as ids(id)
+where ids.id is not null and not exists (select 1 from albums where albums.album_id = ids.id)
@@ -0,0 +1,3 @@
+-- Referenced artist ids that have no row in artists yet
+select distinct ids.id from unnest(%(ids)s::varchar[]) as ids(id)
+where ids.id is not null and not exists (select 1 from artists where artists.artist_id = ids.id)
@@ -0,0 +1 @@
+SELECT distinct date_part('YEAR',played_at) as year,date_part('MONTH',played_at) as month from recent_plays where user_id = %(user_id)s
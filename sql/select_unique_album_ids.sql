@@ -1 +0,0 @@
-SELECT DISTINCT album_id from album
\ No newline at end of file
@@ -1 +0,0 @@
-SELECT DISTINCT artist_id from artist
\ No newline at end of file
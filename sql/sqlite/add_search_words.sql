@@ -0,0 +1,29 @@
+-- Adds the words of the user's tracks liked or played in the given (year,
+-- month) pairs, and of those tracks' albums and artists, to their search
+-- vocabulary
+CREATE VIRTUAL TABLE IF NOT EXISTS temp.tracks_search_words USING fts5vocab(main,tracks_search,instance);
+CREATE VIRTUAL TABLE IF NOT EXISTS temp.albums_search_words USING fts5vocab(main,albums_search,instance);
+CREATE VIRTUAL TABLE IF NOT EXISTS temp.artists_search_words USING fts5vocab(main,artists_search,instance);
+CREATE TEMP TABLE IF NOT EXISTS user_tracks (track_id varchar PRIMARY KEY);
+CREATE TEMP TABLE IF NOT EXISTS user_search_words (word varchar PRIMARY KEY);
+
+DELETE FROM temp.user_tracks;
+INSERT INTO temp.user_tracks (track_id)
+with periods as
+(select distinct json_extract(value,'$[0]') as year,json_extract(value,'$[1]') as month from json_each(:periods))
+SELECT lt.track_id from periods p
+join liked_tracks lt on lt.user_id = :user_id and lt.added_at >= printf('%04d-%02d-01',p.year,p.month) and lt.added_at < date(printf('%04d-%02d-01',p.year,p.month),'+1 month')
+UNION SELECT rp.track_id from periods p
+join recent_plays rp on rp.user_id = :user_id and rp.played_at >= printf('%04d-%02d-01',p.year,p.month) and rp.played_at < date(printf('%04d-%02d-01',p.year,p.month),'+1 month');
+
+DELETE FROM temp.user_search_words;
+INSERT INTO temp.user_search_words (word)
+SELECT v.term from temp.tracks_search_words v join tracks t on t.rowid = v.doc
+where t.track_id in (SELECT track_id from temp.user_tracks)
+UNION SELECT v.term from temp.albums_search_words v join albums al on al.rowid = v.doc
+where al.album_id in (SELECT t.album_id from temp.user_tracks u join tracks t on t.track_id = u.track_id)
+UNION SELECT v.term from temp.artists_search_words v join artists ar on ar.rowid = v.doc
+where ar.artist_id in (SELECT ta.artist_id from temp.user_tracks u join track_artists ta on ta.track_id = u.track_id);
+
+INSERT INTO search_words (user_id,word) SELECT :user_id,word from temp.user_search_words where true
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,2 @@
+update liked_tracks set user_id = :user_id where user_id = '';
+update recent_plays set user_id = :user_id where user_id = ''
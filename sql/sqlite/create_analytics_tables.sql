@@ -0,0 +1,25 @@
+CREATE TABLE IF NOT EXISTS analytics_month
+(user_id varchar,year integer,month integer,songs_count integer,duration_ms bigint,
+most_popular_song varchar,most_popular_album varchar,most_popularity integer,
+least_popular_song varchar,least_popular_album varchar,least_popularity integer,
+PRIMARY KEY(user_id,year,month));
+
+CREATE TABLE IF NOT EXISTS analytics_year_albums
+(user_id varchar,year integer,rank integer,album_name varchar,songs_count integer,PRIMARY KEY(user_id,year,rank));
+
+-- Likes ('liked') and plays ('played') per genre of the track's artists and month
+CREATE TABLE IF NOT EXISTS analytics_genres
+(user_id varchar,source varchar,year integer,month integer,genre varchar,songs_count integer,duration_ms bigint,
+PRIMARY KEY(user_id,source,year,month,genre));
+
+-- Likes and plays per credited artist and year
+CREATE TABLE IF NOT EXISTS analytics_artists
+(user_id varchar,source varchar,year integer,artist_id varchar,songs_count integer,duration_ms bigint,
+PRIMARY KEY(user_id,source,year,artist_id));
+
+CREATE INDEX IF NOT EXISTS analytics_artists_top_idx ON analytics_artists (user_id,source,year,songs_count desc);
+
+-- Plays and listening time per month and hour of day (UTC)
+CREATE TABLE IF NOT EXISTS analytics_listening
+(user_id varchar,year integer,month integer,hour integer,plays integer,duration_ms bigint,
+PRIMARY KEY(user_id,year,month,hour));
@@ -0,0 +1,93 @@
+CREATE TABLE IF NOT EXISTS users
+(user_id varchar PRIMARY KEY,last_full_sync timestamp);
+
+CREATE TABLE IF NOT EXISTS sync_status
+(user_id varchar PRIMARY KEY,state varchar,stage varchar,progress real,
+queued_at timestamp,started_at timestamp,finished_at timestamp,error varchar);
+
+CREATE TABLE IF NOT EXISTS cache_generations
+(name varchar PRIMARY KEY,generation integer NOT NULL);
+
+CREATE TABLE IF NOT EXISTS tracks
+(track_id varchar PRIMARY KEY,track_name varchar,album_id varchar,popularity integer,preview_url varchar,duration_ms integer);
+
+CREATE TABLE IF NOT EXISTS track_artists
+(track_id varchar,artist_id varchar,position integer,PRIMARY KEY(track_id,artist_id));
+
+CREATE TABLE IF NOT EXISTS liked_tracks
+(user_id varchar,track_id varchar,added_at timestamp,PRIMARY KEY(user_id,track_id));
+
+CREATE TABLE IF NOT EXISTS recent_plays
+(user_id varchar,track_id varchar,played_at timestamp,PRIMARY KEY(user_id,track_id,played_at));
+
+CREATE TABLE IF NOT EXISTS albums
+(album_id varchar PRIMARY KEY,album_name varchar,popularity integer);
+
+CREATE TABLE IF NOT EXISTS album_artists
+(album_id varchar,artist_id varchar,position integer,PRIMARY KEY(album_id,artist_id));
+
+CREATE TABLE IF NOT EXISTS album_genres
+(album_id varchar,genre varchar,PRIMARY KEY(album_id,genre));
+
+CREATE TABLE IF NOT EXISTS artists
+(artist_id varchar PRIMARY KEY,artist_name varchar,popularity integer,followers integer);
+
+CREATE TABLE IF NOT EXISTS artist_genres
+(artist_id varchar,genre varchar,PRIMARY KEY(artist_id,genre));
+
+CREATE INDEX IF NOT EXISTS liked_tracks_user_added_at_idx ON liked_tracks (user_id,added_at desc,track_id desc);
+CREATE INDEX IF NOT EXISTS recent_plays_user_played_at_idx ON recent_plays (user_id,played_at desc,track_id desc);
+CREATE INDEX IF NOT EXISTS tracks_album_id_idx ON tracks (album_id);
+CREATE INDEX IF NOT EXISTS track_artists_artist_id_idx ON track_artists (artist_id);
+CREATE INDEX IF NOT EXISTS album_artists_artist_id_idx ON album_artists (artist_id);
+CREATE INDEX IF NOT EXISTS album_genres_genre_idx ON album_genres (genre);
+CREATE INDEX IF NOT EXISTS artist_genres_genre_idx ON artist_genres (genre);
+
+-- Each user's search vocabulary
+CREATE TABLE IF NOT EXISTS search_words
+(user_id varchar,word varchar,PRIMARY KEY(user_id,word));
+
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_search USING fts5(track_name,content='tracks',content_rowid='rowid');
+CREATE VIRTUAL TABLE IF NOT EXISTS albums_search USING fts5(album_name,content='albums',content_rowid='rowid');
+CREATE VIRTUAL TABLE IF NOT EXISTS artists_search USING fts5(artist_name,content='artists',content_rowid='rowid');
+CREATE VIRTUAL TABLE IF NOT EXISTS search_words_trigrams USING fts5(word,content='search_words',content_rowid='rowid',tokenize='trigram');
+
+CREATE TRIGGER IF NOT EXISTS tracks_search_insert AFTER INSERT ON tracks BEGIN
+INSERT INTO tracks_search (rowid,track_name) VALUES (new.rowid,new.track_name);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_search_update AFTER UPDATE OF track_name ON tracks BEGIN
+INSERT INTO tracks_search (tracks_search,rowid,track_name) VALUES ('delete',old.rowid,old.track_name);
+INSERT INTO tracks_search (rowid,track_name) VALUES (new.rowid,new.track_name);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_search_delete AFTER DELETE ON tracks BEGIN
+INSERT INTO tracks_search (tracks_search,rowid,track_name) VALUES ('delete',old.rowid,old.track_name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS albums_search_insert AFTER INSERT ON albums BEGIN
+INSERT INTO albums_search (rowid,album_name) VALUES (new.rowid,new.album_name);
+END;
+CREATE TRIGGER IF NOT EXISTS albums_search_update AFTER UPDATE OF album_name ON albums BEGIN
+INSERT INTO albums_search (albums_search,rowid,album_name) VALUES ('delete',old.rowid,old.album_name);
+INSERT INTO albums_search (rowid,album_name) VALUES (new.rowid,new.album_name);
+END;
+CREATE TRIGGER IF NOT EXISTS albums_search_delete AFTER DELETE ON albums BEGIN
+INSERT INTO albums_search (albums_search,rowid,album_name) VALUES ('delete',old.rowid,old.album_name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS artists_search_insert AFTER INSERT ON artists BEGIN
+INSERT INTO artists_search (rowid,artist_name) VALUES (new.rowid,new.artist_name);
+END;
+CREATE TRIGGER IF NOT EXISTS artists_search_update AFTER UPDATE OF artist_name ON artists BEGIN
+INSERT INTO artists_search (artists_search,rowid,artist_name) VALUES ('delete',old.rowid,old.artist_name);
+INSERT INTO artists_search (rowid,artist_name) VALUES (new.rowid,new.artist_name);
+END;
+CREATE TRIGGER IF NOT EXISTS artists_search_delete AFTER DELETE ON artists BEGIN
+INSERT INTO artists_search (artists_search,rowid,artist_name) VALUES ('delete',old.rowid,old.artist_name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS search_words_insert AFTER INSERT ON search_words BEGIN
+INSERT INTO search_words_trigrams (rowid,word) VALUES (new.rowid,new.word);
+END;
+CREATE TRIGGER IF NOT EXISTS search_words_delete AFTER DELETE ON search_words BEGIN
+INSERT INTO search_words_trigrams (search_words_trigrams,rowid,word) VALUES ('delete',old.rowid,old.word);
+END;
@@ -0,0 +1,2 @@
+delete from liked_tracks where user_id = :user_id and track_id not in (select value from json_each(:song_ids))
+returning cast(strftime('%Y',added_at) as integer) as year,cast(strftime('%m',added_at) as integer) as month
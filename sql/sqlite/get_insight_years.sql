@@ -0,0 +1 @@
+select distinct year from analytics_artists where user_id = :user_id order by year
@@ -0,0 +1,3 @@
+select month,hour,plays,duration_ms from analytics_listening
+where user_id = :user_id and year = :year
+order by month,hour
@@ -0,0 +1,4 @@
+select ar.artist_name,aa.songs_count,aa.duration_ms,ar.followers,ar.popularity from analytics_artists aa
+join artists ar on ar.artist_id = aa.artist_id
+where aa.user_id = :user_id and aa.source = :source and aa.year = :year
+order by aa.songs_count desc,aa.duration_ms desc,ar.artist_name limit :limit
@@ -0,0 +1 @@
+SELECT distinct year as years from analytics_month where user_id = :user_id order by years
\ No newline at end of file
@@ -0,0 +1,8 @@
+INSERT OR IGNORE INTO albums (album_id,album_name,popularity)
+SELECT album_id,album_name,popularity FROM album GROUP BY album_id;
+INSERT OR IGNORE INTO album_artists (album_id,artist_id,position)
+SELECT album_id,artists,row_number() over (partition by album_id order by artists) - 1
+FROM (SELECT DISTINCT album_id,artists FROM album WHERE artists IS NOT NULL);
+INSERT OR IGNORE INTO album_genres (album_id,genre)
+SELECT DISTINCT album_id,genres FROM album WHERE genres IS NOT NULL AND genres <> 'N.A';
+ALTER TABLE album RENAME TO album_legacy;
@@ -0,0 +1,5 @@
+INSERT OR IGNORE INTO artists (artist_id,artist_name,popularity,followers)
+SELECT artist_id,artist_name,popularity,followers FROM artist GROUP BY artist_id;
+INSERT OR IGNORE INTO artist_genres (artist_id,genre)
+SELECT DISTINCT artist_id,genres FROM artist WHERE genres IS NOT NULL AND genres <> 'N.A';
+ALTER TABLE artist RENAME TO artist_legacy;
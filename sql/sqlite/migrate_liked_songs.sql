@@ -0,0 +1,7 @@
+INSERT OR IGNORE INTO tracks (track_id,track_name,album_id,popularity,preview_url,duration_ms)
+SELECT song_id,song_name,album,popularity,preview_url,duration_ms FROM liked_songs GROUP BY song_id;
+INSERT OR IGNORE INTO track_artists (track_id,artist_id,position)
+SELECT song_id,artists,row_number() over (partition by song_id order by artists) - 1 FROM (SELECT DISTINCT song_id,artists FROM liked_songs);
+INSERT OR IGNORE INTO liked_tracks (user_id,track_id,added_at)
+SELECT '',song_id,max(added_at) FROM liked_songs GROUP BY song_id;
+ALTER TABLE liked_songs RENAME TO liked_songs_legacy;
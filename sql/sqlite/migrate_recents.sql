@@ -0,0 +1,7 @@
+INSERT OR IGNORE INTO tracks (track_id,track_name,album_id,popularity,preview_url,duration_ms)
+SELECT song_id,song_name,album,popularity,preview_url,duration_ms FROM recents GROUP BY song_id;
+INSERT OR IGNORE INTO track_artists (track_id,artist_id,position)
+SELECT song_id,artists,row_number() over (partition by song_id order by artists) - 1 FROM (SELECT DISTINCT song_id,artists FROM recents);
+INSERT OR IGNORE INTO recent_plays (user_id,track_id,played_at)
+SELECT DISTINCT '',song_id,added_at FROM recents;
+ALTER TABLE recents RENAME TO recents_legacy;
@@ -0,0 +1,20 @@
+-- Rebuilds the likes and plays tables stored before the data was kept per
+-- user with a user_id in their primary keys. Existing rows get an empty
+-- user_id until a user claims them; the analytics tables only hold derived
+-- rows and are dropped to be rebuilt per user.
+ALTER TABLE liked_tracks RENAME TO liked_tracks_shared;
+ALTER TABLE recent_plays RENAME TO recent_plays_shared;
+DROP INDEX IF EXISTS liked_tracks_added_at_idx;
+DROP INDEX IF EXISTS recent_plays_played_at_idx;
+DROP TABLE IF EXISTS analytics_month;
+DROP TABLE IF EXISTS analytics_year_albums;
+
+CREATE TABLE liked_tracks
+(user_id varchar,track_id varchar,added_at timestamp,PRIMARY KEY(user_id,track_id));
+CREATE TABLE recent_plays
+(user_id varchar,track_id varchar,played_at timestamp,PRIMARY KEY(user_id,track_id,played_at));
+
+INSERT INTO liked_tracks (user_id,track_id,added_at) SELECT '',track_id,added_at FROM liked_tracks_shared;
+INSERT INTO recent_plays (user_id,track_id,played_at) SELECT '',track_id,played_at FROM recent_plays_shared;
+DROP TABLE liked_tracks_shared;
+DROP TABLE recent_plays_shared;
@@ -0,0 +1,37 @@
+delete from analytics_listening where user_id = :user_id and (year,month) in (select json_extract(value,'$[0]'),json_extract(value,'$[1]') from json_each(:periods));
+
+insert into analytics_listening
+with periods as
+(select distinct json_extract(value,'$[0]') as year,json_extract(value,'$[1]') as month from json_each(:periods))
+
+select :user_id,p.year,p.month,cast(strftime('%H',rp.played_at) as integer) as hour,count(*),coalesce(sum(t.duration_ms),0) from periods p
+join recent_plays rp on rp.user_id = :user_id and rp.played_at >= printf('%04d-%02d-01',p.year,p.month) and rp.played_at < date(printf('%04d-%02d-01',p.year,p.month),'+1 month')
+left join tracks t on t.track_id = rp.track_id
+group by p.year,p.month,hour;
+
+delete from analytics_genres where user_id = :user_id and source = 'played' and (year,month) in (select json_extract(value,'$[0]'),json_extract(value,'$[1]') from json_each(:periods));
+
+insert into analytics_genres
+with periods as
+(select distinct json_extract(value,'$[0]') as year,json_extract(value,'$[1]') as month from json_each(:periods)),
+
+genres as
+(select distinct p.year,p.month,rp.track_id,rp.played_at,t.duration_ms,ag.genre from periods p
+join recent_plays rp on rp.user_id = :user_id and rp.played_at >= printf('%04d-%02d-01',p.year,p.month) and rp.played_at < date(printf('%04d-%02d-01',p.year,p.month),'+1 month')
+join tracks t on t.track_id = rp.track_id
+join track_artists ta on ta.track_id = rp.track_id
+join artist_genres ag on ag.artist_id = ta.artist_id)
+
+select :user_id,'played',year,month,genre,count(*),sum(duration_ms) from genres group by year,month,genre;
+
+delete from analytics_artists where user_id = :user_id and source = 'played' and year in (select json_extract(value,'$[0]') from json_each(:periods));
+
+insert into analytics_artists
+with years as
+(select distinct json_extract(value,'$[0]') as year from json_each(:periods))
+
+select :user_id,'played',y.year,ta.artist_id,count(*),sum(t.duration_ms) from years y
+join recent_plays rp on rp.user_id = :user_id and rp.played_at >= printf('%04d-01-01',y.year) and rp.played_at < printf('%04d-01-01',y.year + 1)
+join tracks t on t.track_id = rp.track_id
+join track_artists ta on ta.track_id = rp.track_id
+group by y.year,ta.artist_id;
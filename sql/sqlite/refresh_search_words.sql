@@ -0,0 +1,26 @@
+-- Rebuilds the user's search vocabulary from the names of their liked and
+-- played tracks and of those tracks' albums and artists, as the words the
+-- name indexes hold
+CREATE VIRTUAL TABLE IF NOT EXISTS temp.tracks_search_words USING fts5vocab(main,tracks_search,instance);
+CREATE VIRTUAL TABLE IF NOT EXISTS temp.albums_search_words USING fts5vocab(main,albums_search,instance);
+CREATE VIRTUAL TABLE IF NOT EXISTS temp.artists_search_words USING fts5vocab(main,artists_search,instance);
+CREATE TEMP TABLE IF NOT EXISTS user_tracks (track_id varchar PRIMARY KEY);
+CREATE TEMP TABLE IF NOT EXISTS user_search_words (word varchar PRIMARY KEY);
+
+DELETE FROM temp.user_tracks;
+INSERT INTO temp.user_tracks (track_id)
+SELECT track_id from liked_tracks where user_id = :user_id
+UNION SELECT track_id from recent_plays where user_id = :user_id;
+
+DELETE FROM temp.user_search_words;
+INSERT INTO temp.user_search_words (word)
+SELECT v.term from temp.tracks_search_words v join tracks t on t.rowid = v.doc
+where t.track_id in (SELECT track_id from temp.user_tracks)
+UNION SELECT v.term from temp.albums_search_words v join albums al on al.rowid = v.doc
+where al.album_id in (SELECT t.album_id from temp.user_tracks u join tracks t on t.track_id = u.track_id)
+UNION SELECT v.term from temp.artists_search_words v join artists ar on ar.rowid = v.doc
+where ar.artist_id in (SELECT ta.artist_id from temp.user_tracks u join track_artists ta on ta.track_id = u.track_id);
+
+DELETE FROM search_words where user_id = :user_id and word not in (SELECT word from temp.user_search_words);
+INSERT INTO search_words (user_id,word) SELECT :user_id,word from temp.user_search_words where true
+ON CONFLICT DO NOTHING;
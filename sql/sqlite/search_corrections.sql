@@ -0,0 +1,3 @@
+select w.word from search_words_trigrams s join search_words w on w.rowid = s.rowid
+where search_words_trigrams match :match and w.user_id = :user_id
+order by rank limit :limit
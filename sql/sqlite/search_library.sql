@@ -0,0 +1,43 @@
+with by_track as
+
+(select m.track_id,3 as weight,m.popularity from
+(select t.track_id,t.popularity from tracks_search s join tracks t on t.rowid = s.rowid
+where tracks_search match :match
+order by t.popularity desc nulls last,t.track_id limit -1) m
+where coalesce((select true from liked_tracks lt where lt.user_id = :user_id and lt.track_id = m.track_id),
+(select true from recent_plays rp where rp.user_id = :user_id and rp.track_id = m.track_id limit 1))
+limit :limit),
+
+by_album as
+
+(select m.track_id,2 as weight,m.popularity from
+(select t.track_id,t.popularity from albums_search s join albums al on al.rowid = s.rowid join tracks t on t.album_id = al.album_id
+where albums_search match :match
+order by t.popularity desc nulls last,t.track_id limit -1) m
+where coalesce((select true from liked_tracks lt where lt.user_id = :user_id and lt.track_id = m.track_id),
+(select true from recent_plays rp where rp.user_id = :user_id and rp.track_id = m.track_id limit 1))
+limit :limit),
+
+by_artist as
+
+(select m.track_id,1 as weight,m.popularity from
+(select t.track_id,t.popularity from artists_search s join artists ar on ar.rowid = s.rowid join track_artists ta on ta.artist_id = ar.artist_id join tracks t on t.track_id = ta.track_id
+where artists_search match :match
+order by t.popularity desc nulls last,t.track_id limit -1) m
+where coalesce((select true from liked_tracks lt where lt.user_id = :user_id and lt.track_id = m.track_id),
+(select true from recent_plays rp where rp.user_id = :user_id and rp.track_id = m.track_id limit 1))
+limit :limit),
+
+library as
+
+(select track_id,max(weight) as weight,max(popularity) as popularity from
+(select * from by_track union all select * from by_album union all select * from by_artist) m
+group by track_id order by weight desc,popularity desc nulls last,track_id limit :limit)
+
+select t.track_id,t.track_name,al.album_name,
+(select group_concat(artist_name) from (select ar.artist_name from track_artists ta,artists ar
+where ta.track_id = t.track_id and ar.artist_id = ta.artist_id order by ta.position)) as artists,
+t.popularity,t.preview_url,lt.added_at as "added_at [timestamp]"
+from library l join tracks t on t.track_id = l.track_id left join albums al on al.album_id = t.album_id
+left join liked_tracks lt on lt.user_id = :user_id and lt.track_id = l.track_id
+order by l.weight desc,l.popularity desc nulls last,l.track_id
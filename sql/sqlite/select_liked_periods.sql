@@ -0,0 +1 @@
+SELECT distinct cast(strftime('%Y',added_at) as integer) as year,cast(strftime('%m',added_at) as integer) as month from liked_tracks where user_id = :user_id
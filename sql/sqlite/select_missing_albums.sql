@@ -0,0 +1,3 @@
+-- Referenced album ids that have no row in albums yet
+select distinct ids.value from json_each(:ids) as ids
+where ids.value is not null and not exists (select 1 from albums where albums.album_id = ids.value)
@@ -0,0 +1,3 @@
+-- Referenced artist ids that have no row in artists yet
+select distinct ids.value from json_each(:ids) as ids
+where ids.value is not null and not exists (select 1 from artists where artists.artist_id = ids.value)
@@ -0,0 +1 @@
+SELECT distinct cast(strftime('%Y',played_at) as integer) as year,cast(strftime('%m',played_at) as integer) as month from recent_plays where user_id = :user_id
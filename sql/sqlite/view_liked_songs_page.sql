@@ -0,0 +1,12 @@
+with page as
+
+(select track_id,added_at from liked_tracks
+where user_id = :user_id and (:after_added_at is null or (added_at,track_id) < (:after_added_at,:after_song_id))
+order by added_at desc,track_id desc limit coalesce(:limit,-1) offset :offset)
+
+select t.track_id,t.track_name,al.album_name,
+(select group_concat(artist_name) from (select ar.artist_name from track_artists ta,artists ar
+where ta.track_id = t.track_id and ar.artist_id = ta.artist_id order by ta.position)) as artists,
+t.popularity,t.preview_url,p.added_at as "added_at [timestamp]"
+from page p join tracks t on t.track_id = p.track_id left join albums al on al.album_id = t.album_id
+order by p.added_at desc,p.track_id desc
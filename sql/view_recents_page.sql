@@ -0,0 +1,12 @@
+with page as
+
+(select track_id,played_at from recent_plays
+where user_id = %(user_id)s and (%(after_added_at)s is null or (played_at,track_id) < (%(after_added_at)s,%(after_song_id)s))
+order by played_at desc,track_id desc limit %(limit)s offset %(offset)s)
+
+select t.track_id,t.track_name,al.album_name,
+(select string_agg(ar.artist_name,',' order by ta.position) from track_artists ta,artists ar
+where ta.track_id = t.track_id and ar.artist_id = ta.artist_id) as artists,
+t.popularity,t.preview_url,p.played_at
+from page p join tracks t on t.track_id = p.track_id left join albums al on al.album_id = t.album_id
+order by p.played_at desc,p.track_id desc
@@ -0,0 +1,334 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import metrics
+import storage
+
+# Embedded storage backend with the same primitives as postgres.py, for running
+# the app, the sync pipeline and the benchmarks without a database server.
+# The SQL lives in sql/sqlite/.
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'spotify.db')
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('timestamp', lambda value: datetime.fromisoformat(value.decode()))
+
+_local = threading.local()
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+#Connection that reports each statement's run time to metrics and the
+#slow-query log
+class TimedConnection(sqlite3.Connection):
+    def execute(self, sql, parameters = ()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.record_query('sqlite', time.perf_counter() - start, sql, parameters)
+
+    def executemany(self, sql, parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            metrics.record_query('sqlite', time.perf_counter() - start, sql)
+
+    def executescript(self, sql):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql)
+        finally:
+            metrics.record_query('sqlite', time.perf_counter() - start, sql)
+
+def sqlite_init(path = None):
+    conn = sqlite3.connect(path or SQLITE_PATH, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                           factory=TimedConnection)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+#One connection per thread, opened on first use
+@contextmanager
+def connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = sqlite_init()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+
+#Every statement in sql/sqlite/, read once at import by file name. sqlite3
+#keeps the compiled form of recently run statements per connection, so the
+#same text skips parsing on repeated calls.
+STATEMENTS = storage.load_statements(os.path.join(os.path.dirname(os.path.abspath(__file__)),'sql','sqlite'))
+
+def _query(name):
+    return STATEMENTS[name]
+
+#sqlite3 runs one statement per execute, so scripts with parameters are split
+def _execute_script(conn,query,params):
+    for statement in query.split(';'):
+        if statement.strip():
+            conn.execute(statement,params)
+
+def _quote(identifier):
+    return '"{}"'.format(identifier.replace('"','""'))
+
+#In-process stand-in for postgres.advisory_lock
+@contextmanager
+def advisory_lock(name):
+    with _locks_guard:
+        lock = _locks.setdefault(name, threading.Lock())
+    acquired = lock.acquire(blocking=False)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            lock.release()
+
+#Old one-row-per-artist tables and the script that moves each into the
+#normalized tables
+LEGACY_TABLES = ('liked_songs','recents','album','artist')
+#Full-text tables behind search_library. The ones a run creates are indexed
+#from the rows already stored, and users without a search vocabulary get
+#theirs built from the stored names.
+SEARCH_TABLES = ('tracks_search','albums_search','artists_search','search_words_trigrams')
+
+def create_tables():
+    with connection() as conn:
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(liked_tracks)')]
+        if columns and 'user_id' not in columns:
+            conn.executescript('BEGIN;' + _query('migrate_user_columns') + 'COMMIT;')
+        #The search vocabulary was shared by all users before; it is rebuilt per user
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(search_words)')]
+        if columns and 'user_id' not in columns:
+            conn.executescript('DROP TABLE search_words_trigrams; DROP TABLE search_words;')
+        existing = set(row[0] for row in conn.execute("SELECT name from sqlite_master where type = 'table'"))
+        conn.executescript(_query('create_tables'))
+        if 'last_full_sync' not in [row[1] for row in conn.execute('PRAGMA table_info(users)')]:
+            conn.execute('ALTER TABLE users ADD COLUMN last_full_sync timestamp')
+        for table in LEGACY_TABLES:
+            if table in existing:
+                conn.executescript('BEGIN;' + _query('migrate_' + table) + 'COMMIT;')
+        for table in SEARCH_TABLES:
+            if table not in existing:
+                conn.execute('INSERT INTO {0} ({0}) VALUES (\'rebuild\')'.format(_quote(table)))
+        conn.commit()
+        for user_id, in conn.execute('SELECT user_id from users u where NOT EXISTS (SELECT 1 from search_words w where w.user_id = u.user_id)').fetchall():
+            _execute_script(conn,_query('refresh_search_words'),{'user_id': user_id})
+        conn.commit()
+
+def add_user(user_id):
+    with connection() as conn:
+        conn.execute('INSERT INTO users (user_id) VALUES (?) ON CONFLICT DO NOTHING', (user_id,))
+        conn.commit()
+
+def select_users():
+    with connection() as conn:
+        res = conn.execute('SELECT user_id from users').fetchall()
+    return [row[0] for row in res]
+
+def select_last_full_sync(user_id):
+    with connection() as conn:
+        res = conn.execute('SELECT last_full_sync as "last_full_sync [timestamp]" from users where user_id = ?', (user_id,)).fetchone()
+    return res[0] if res else None
+
+def record_full_sync(user_id,finished_at):
+    with connection() as conn:
+        conn.execute('UPDATE users SET last_full_sync = ? where user_id = ?', (finished_at,user_id))
+        conn.commit()
+
+def save_sync_status(user_id,status):
+    columns = storage.SYNC_STATUS_COLUMNS
+    with connection() as conn:
+        conn.execute('INSERT INTO sync_status (user_id,{0}) VALUES (?,{1}) ON CONFLICT (user_id) DO UPDATE SET {2}'.format(
+                         ','.join(columns),','.join('?' * len(columns)),
+                         ','.join('{0} = excluded.{0}'.format(column) for column in columns)),
+                     [user_id] + [status[column] for column in columns])
+        conn.commit()
+
+def select_sync_status(user_id):
+    columns = storage.SYNC_STATUS_COLUMNS
+    with connection() as conn:
+        res = conn.execute('SELECT {} from sync_status where user_id = ?'.format(','.join(columns)), (user_id,)).fetchone()
+    return dict(zip(columns,res)) if res else None
+
+#Write counters of the query cache's tables, shared with other processes that
+#open the same database file
+def select_cache_generations(names):
+    with connection() as conn:
+        res = conn.execute('SELECT name,generation from cache_generations where name in (SELECT value from json_each(?))',
+                           (json.dumps(list(names)),)).fetchall()
+    return dict(res)
+
+def bump_cache_generations(names):
+    with connection() as conn:
+        conn.execute('INSERT INTO cache_generations (name,generation) SELECT value,1 from json_each(?) where true '
+                     'ON CONFLICT (name) DO UPDATE SET generation = generation + 1', (json.dumps(sorted(set(names))),))
+        conn.commit()
+
+#Runs a registered read statement and returns its rows. Lists are passed as
+#JSON arrays, which the statements read with json_each.
+def fetch(name,params):
+    params = {key: json.dumps(value) if isinstance(value,list) else value for key,value in params.items()}
+    with connection() as conn:
+        res = conn.execute(_query(name),params).fetchall()
+    return res
+
+def claim_unowned_rows(user_id):
+    with connection() as conn:
+        before = conn.total_changes
+        _execute_script(conn,_query('claim_unowned_rows'),{'user_id': user_id})
+        conn.commit()
+        res = conn.total_changes - before
+    return res
+
+def select_high_water(fact,column,user_id):
+    with connection() as conn:
+        res = conn.execute('SELECT MAX({0}) as "{0} [timestamp]" from {1} where user_id = ?'.format(column,_quote(fact)),(user_id,)).fetchone()
+    return res[0]
+
+def delete_unliked_songs(user_id,song_ids):
+    with connection() as conn:
+        res = conn.execute(_query('delete_unliked_songs'), {'user_id': user_id,'song_ids': json.dumps(list(song_ids))}).fetchall()
+        conn.commit()
+    return res
+
+TIMESTAMPS = ('added_at','played_at')
+
+#Spotify timestamps ('2020-01-01T10:00:00Z') are stored in the same text form
+#as the datetime adapter above so they compare correctly
+def _timestamp(value):
+    if isinstance(value, str) and value.endswith('Z'):
+        return datetime.fromisoformat(value[:-1])
+    return value
+
+def _bulk_upsert(conn,table,columns,rows,key = None):
+    key = key or storage.KEYS[table]
+    updates = [column for column in columns if column not in key]
+    if updates:
+        on_conflict = 'DO UPDATE SET {} WHERE ({}) IS NOT ({})'.format(
+            ','.join('{0} = excluded.{0}'.format(_quote(column)) for column in updates),
+            ','.join('{}.{}'.format(_quote(table),_quote(column)) for column in updates),
+            ','.join('excluded.{}'.format(_quote(column)) for column in updates))
+    else:
+        on_conflict = 'DO NOTHING'
+    query = 'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT ({}) {}'.format(
+        _quote(table),','.join(_quote(column) for column in columns),','.join('?' * len(columns)),
+        ','.join(_quote(column) for column in key),on_conflict)
+
+    timestamps = [i for i,column in enumerate(columns) if column in TIMESTAMPS]
+    def prepared(row):
+        row = list(row)
+        for i in timestamps:
+            row[i] = _timestamp(row[i])
+        return row
+
+    before = conn.total_changes
+    conn.executemany(query,map(prepared,rows) if timestamps else rows)
+    return conn.total_changes - before
+
+def bulk_upsert(table,columns,rows,key = None):
+    with connection() as conn:
+        res = _bulk_upsert(conn,table,columns,rows,key)
+        conn.commit()
+    return res
+
+def upsert_tables(batches):
+    with connection() as conn:
+        changed = {table: _bulk_upsert(conn,table,columns,rows) for table,(columns,rows) in batches.items()}
+        conn.commit()
+    return changed
+
+def create_analytics_tables(user_id):
+    with connection() as conn:
+        conn.executescript(_query('create_analytics_tables'))
+        res = conn.execute('SELECT NOT EXISTS (SELECT 1 from analytics_month where user_id = :user_id) '
+                           'OR NOT EXISTS (SELECT 1 from analytics_artists where user_id = :user_id and source = \'liked\')', {'user_id': user_id}).fetchone()
+    return bool(res[0])
+
+def refresh_analytics(user_id,periods = None):
+    with connection() as conn:
+        if periods is None:
+            periods = conn.execute(_query('select_liked_periods'), {'user_id': user_id}).fetchall()
+            conn.execute('DELETE FROM analytics_month where user_id = ?', (user_id,))
+            conn.execute('DELETE FROM analytics_year_albums where user_id = ?', (user_id,))
+            conn.execute('DELETE FROM analytics_genres where user_id = ? and source = \'liked\'', (user_id,))
+            conn.execute('DELETE FROM analytics_artists where user_id = ? and source = \'liked\'', (user_id,))
+        if periods:
+            params = {'user_id': user_id,'periods': json.dumps([[int(year),int(month)] for year,month in periods])}
+            _execute_script(conn,_query('refresh_analytics'),params)
+        conn.commit()
+
+def refresh_play_analytics(user_id,periods = None):
+    with connection() as conn:
+        empty = conn.execute('SELECT NOT EXISTS (SELECT 1 from analytics_listening where user_id = ?)', (user_id,)).fetchone()[0]
+        if periods is None or empty:
+            periods = conn.execute(_query('select_play_periods'), {'user_id': user_id}).fetchall()
+            conn.execute('DELETE FROM analytics_listening where user_id = ?', (user_id,))
+            conn.execute('DELETE FROM analytics_genres where user_id = ? and source = \'played\'', (user_id,))
+            conn.execute('DELETE FROM analytics_artists where user_id = ? and source = \'played\'', (user_id,))
+        if periods:
+            params = {'user_id': user_id,'periods': json.dumps([[int(year),int(month)] for year,month in periods])}
+            _execute_script(conn,_query('refresh_play_analytics'),params)
+        conn.commit()
+
+def refresh_search_words(user_id,periods = None):
+    with connection() as conn:
+        if periods is None:
+            _execute_script(conn,_query('refresh_search_words'),{'user_id': user_id})
+        else:
+            params = {'user_id': user_id,'periods': json.dumps([[int(year),int(month)] for year,month in periods])}
+            _execute_script(conn,_query('add_search_words'),params)
+        conn.commit()
+
+
+#Search
+
+# Stored words sharing the most trigrams with an unknown word that are scored against it
+SEARCH_CANDIDATES = 20
+
+#Trigrams of a word, padded the way pg_trgm pads them
+def _trigrams(word):
+    padded = '  {} '.format(word)
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+#Share of the term's trigrams found in the word, close to pg_trgm's word_similarity
+def _similarity(term,word):
+    wanted = _trigrams(term)
+    return len(wanted & _trigrams(word)) / len(wanted)
+
+#Stand-in for postgres._search_match: an FTS5 query for names having a word
+#starting with each term, with terms none of the user's words start with
+#swapped for their words closest to them
+def _search_match(conn,user_id,terms):
+    parts = []
+    for term in terms:
+        words = []
+        if conn.execute('SELECT 1 from search_words where user_id = ? and word GLOB ? limit 1', (user_id,term + '*')).fetchone() is None:
+            trigrams = set(term[i:i+3] for i in range(len(term) - 2))
+            if trigrams:
+                candidates = conn.execute(_query('search_corrections'), {
+                    'match': ' OR '.join('"{}"'.format(trigram) for trigram in trigrams),
+                    'user_id': user_id,
+                    'limit': SEARCH_CANDIDATES,
+                }).fetchall()
+                scored = sorted((-_similarity(term,word),word) for word, in candidates)
+                words = [word for score,word in scored if -score >= storage.SEARCH_SIMILARITY][:storage.SEARCH_CORRECTIONS]
+        parts.append('({})'.format(' OR '.join('"{}"'.format(word) for word in words)) if words else '"{}"*'.format(term))
+    return ' AND '.join(parts)
+
+def match_library(user_id,terms,limit):
+    with connection() as conn:
+        res = conn.execute(_query('search_library'), {'match': _search_match(conn,user_id,terms),'user_id': user_id,'limit': limit}).fetchall()
+    return res
+
+metrics.instrument(globals(),'sqlite',exclude=('connection','advisory_lock'))
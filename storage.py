@@ -0,0 +1,328 @@
+import importlib
+import os
+import re
+
+import cache
+import metrics
+
+# Selects the storage backend behind the ingestion and page API.
+# SPOTIFY_STORAGE=postgres (default) uses postgres.py against a PostgreSQL
+# server; SPOTIFY_STORAGE=sqlite uses the embedded sqlite_store.py.
+#
+# What both backends share lives here: turning API columns into table rows,
+# shaping query results, the query cache and its invalidation. A backend only
+# holds its connection handling, its upsert and the SQL it runs; whatever this
+# module does not define is looked up on it.
+BACKENDS = {
+    'postgres': 'postgres',
+    'sqlite': 'sqlite_store',
+}
+BACKEND = os.getenv('SPOTIFY_STORAGE', 'postgres')
+
+_backend = None
+
+
+def backend():
+    global _backend
+    if _backend is None:
+        if BACKEND not in BACKENDS:
+            raise ValueError('unknown SPOTIFY_STORAGE {!r}, expected one of {}'.format(BACKEND, ', '.join(BACKENDS)))
+        _backend = importlib.import_module(BACKENDS[BACKEND])
+        cache.share_generations(_backend.select_cache_generations, _backend.bump_cache_generations)
+    return _backend
+
+
+#storage.create_tables(...) etc. resolve on the selected backend
+def __getattr__(name):
+    if name.startswith('__'):
+        raise AttributeError(name)
+    return getattr(backend(), name)
+
+
+# Every statement in a backend's SQL directory, read once at import by file name
+def load_statements(directory):
+    statements = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.sql'):
+            with open(os.path.join(directory, filename)) as statement:
+                statements[filename[:-4]] = statement.read()
+    return statements
+
+
+# Table and timestamp column behind the 'liked_songs' and 'recents' listings
+HIGH_WATER = {
+    'liked_songs': ('liked_tracks', 'added_at'),
+    'recents': ('recent_plays', 'played_at'),
+}
+
+# Tables keyed by user; their cache entries are invalidated per user
+USER_TABLES = ('liked_tracks', 'recent_plays', 'analytics_month', 'analytics_year_albums',
+               'analytics_genres', 'analytics_artists', 'analytics_listening', 'search_words')
+
+# Key each table is upserted on, matching the primary keys in create_tables.sql
+KEYS = {
+    'tracks': ('track_id',),
+    'track_artists': ('track_id', 'artist_id'),
+    'liked_tracks': ('user_id', 'track_id'),
+    'recent_plays': ('user_id', 'track_id', 'played_at'),
+    'albums': ('album_id',),
+    'album_artists': ('album_id', 'artist_id'),
+    'album_genres': ('album_id', 'genre'),
+    'artists': ('artist_id',),
+    'artist_genres': ('artist_id', 'genre'),
+}
+
+# Progress of the user's latest sync, written by the process running it and
+# read by whichever web worker the status poll reaches
+SYNC_STATUS_COLUMNS = ('state', 'stage', 'progress', 'queued_at', 'started_at', 'finished_at', 'error')
+
+
+def _cache_name(table, user_id):
+    return '{}:{}'.format(table, user_id) if table in USER_TABLES else table
+
+
+# Hands likes and plays stored before data was kept per user to `user_id`
+def claim_unowned_rows(user_id):
+    res = backend().claim_unowned_rows(user_id)
+    if res:
+        cache.invalidate(*[_cache_name(table, user_id) for table in USER_TABLES])
+    return res
+
+
+# Newest added_at or played_at stored for the user, and whether there is one
+def check_liked_songs(table, user_id):
+    fact, column = HIGH_WATER[table]
+    res = backend().select_high_water(fact, column, user_id)
+    if res is not None:
+        return res, True
+    return None, False
+
+
+# Removes the user's liked songs that are no longer in the given list of saved
+# song ids and returns the (year, month) pairs they were liked in
+def delete_unliked_songs(user_id, song_ids):
+    res = backend().delete_unliked_songs(user_id, song_ids)
+    if res:
+        cache.invalidate(_cache_name('liked_tracks', user_id))
+    return set((int(year), int(month)) for year, month in res)
+
+
+# Merges rows into `table`, updating rows whose key already exists. Returns
+# the number of rows inserted or updated.
+def bulk_upsert(table, columns, rows, key=None):
+    res = backend().bulk_upsert(table, columns, rows, key)
+    if res:
+        cache.invalidate(table)
+    return res
+
+
+# Upserts several tables in one transaction; `batches` maps each table to its
+# (columns, rows). Returns the number of rows changed per table.
+def _upsert_tables(batches, user_id=None):
+    changed = backend().upsert_tables(batches)
+    cache.invalidate(*[_cache_name(table, user_id) for table, count in changed.items() if count])
+    return changed
+
+
+# Columns from spotify.track_columns, stored as the user's liked tracks or,
+# for table='recents', as their plays
+def add_liked_songs_dict(songs, table, user_id):
+    if not songs or not songs['song_id']:
+        return 0
+    fact, column = HIGH_WATER[table]
+    song_ids = songs['song_id']
+    changed = _upsert_tables({
+        'tracks': (('track_id', 'track_name', 'album_id', 'popularity', 'preview_url', 'duration_ms'),
+                   zip(song_ids, songs['song_name'], songs['album'], songs['popularity'], songs['preview_url'], songs['duration_ms'])),
+        'track_artists': (('track_id', 'artist_id', 'position'),
+                          ((song_id, artist, position) for song_id, artists in zip(song_ids, songs['artists']) for position, artist in enumerate(artists))),
+        fact: (('user_id', 'track_id', column), ((user_id, song_id, added_at) for song_id, added_at in zip(song_ids, songs['added_at']))),
+    }, user_id)
+    return changed[fact]
+
+
+def add_albums_dict(albums):
+    if not albums or not albums['album_id']:
+        return 0
+    album_ids = albums['album_id']
+    changed = _upsert_tables({
+        'albums': (('album_id', 'album_name', 'popularity'), zip(album_ids, albums['album_name'], albums['popularity'])),
+        'album_artists': (('album_id', 'artist_id', 'position'),
+                          ((album_id, artist, position) for album_id, artists in zip(album_ids, albums['artists']) for position, artist in enumerate(artists))),
+        'album_genres': (('album_id', 'genre'), ((album_id, genre) for album_id, genres in zip(album_ids, albums['genres']) for genre in genres)),
+    })
+    return changed['albums']
+
+
+def add_artists_dict(artists):
+    if not artists or not artists['artist_id']:
+        return 0
+    artist_ids = artists['artist_id']
+    changed = _upsert_tables({
+        'artists': (('artist_id', 'artist_name', 'popularity', 'followers'),
+                    zip(artist_ids, artists['artist_name'], artists['popularity'], artists['followers'])),
+        'artist_genres': (('artist_id', 'genre'), ((artist_id, genre) for artist_id, genres in zip(artist_ids, artists['genres']) for genre in genres)),
+    })
+    return changed['artists']
+
+
+# Of the given artist or album ids, the ones not stored yet, found with an
+# anti-join in the database so only those are fetched from Spotify
+def select_missing_artists(artist_ids):
+    return [row[0] for row in backend().fetch('select_missing_artists', {'ids': list(artist_ids)})]
+
+
+def select_missing_albums(album_ids):
+    return [row[0] for row in backend().fetch('select_missing_albums', {'ids': list(album_ids)})]
+
+
+# Keyset pagination: pass the (added_at, track_id) of the last row already shown
+# as `after`, or fall back to an offset for random page jumps
+def _select_page(name, user_id, limit, after, offset):
+    return backend().fetch(name, {
+        'user_id': user_id,
+        'limit': limit,
+        'offset': offset,
+        'after_added_at': after[0] if after else None,
+        'after_song_id': after[1] if after else None,
+    })
+
+
+@cache.cached('liked_tracks:{}', 'tracks', 'track_artists', 'artists', 'albums')
+def select_liked_songs_page(user_id, limit=50, after=None, offset=0):
+    return _select_page('view_liked_songs_page', user_id, limit, after, offset)
+
+
+@cache.cached('recent_plays:{}', 'tracks', 'track_artists', 'artists', 'albums')
+def select_recent_songs_page(user_id, limit=50, after=None, offset=0):
+    return _select_page('view_recents_page', user_id, limit, after, offset)
+
+
+@cache.cached('liked_tracks:{}')
+def count_liked_songs(user_id):
+    return backend().fetch('count_liked_songs', {'user_id': user_id})[0][0]
+
+
+@cache.cached('recent_plays:{}')
+def count_recent_songs(user_id):
+    return backend().fetch('count_recents', {'user_id': user_id})[0][0]
+
+
+def select_liked_songs(user_id, beg, end='all'):
+    limit = None if end == 'all' else end - beg
+    return select_liked_songs_page(user_id, limit, offset=beg)
+
+
+def select_recent_songs(user_id, beg, end='all'):
+    limit = None if end == 'all' else end - beg
+    return select_recent_songs_page(user_id, limit, offset=beg)
+
+
+# Analytics
+
+@cache.cached('analytics_month:{}')
+def get_years(user_id):
+    return backend().fetch('get_years', {'user_id': user_id})
+
+
+# Recomputes the user's analytics rows for the given (year, month) pairs, or
+# rebuilds them from all of their liked tracks when no periods are given
+def refresh_analytics(user_id, periods=None):
+    backend().refresh_analytics(user_id, periods)
+    cache.invalidate(*[_cache_name(table, user_id) for table in ('analytics_month', 'analytics_year_albums', 'analytics_genres', 'analytics_artists')])
+
+
+# Top albums plus the most and least popular song, song count and total duration
+# of every month, read from the precomputed tables. Months without liked songs are None.
+@cache.cached('analytics_month:{}', 'analytics_year_albums:{}')
+def get_year_summary(user_id, year):
+    res = backend().fetch('get_year_summary', {'user_id': user_id, 'year': int(year)})
+
+    summary = {
+        'albums': [],
+        'most_popular': [None]*12,
+        'least_popular': [None]*12,
+        'songs_count': [0]*12,
+        'duration_ms': [0]*12,
+    }
+    for kind, position, most_song, most_album, most_value, least_song, least_album, least_value, songs_count, duration_ms in res:
+        if kind == 'album':
+            summary['albums'].append((position, most_album, most_value))
+            continue
+        if most_song is not None:
+            summary['most_popular'][position-1] = (most_song, most_album, most_value)
+            summary['least_popular'][position-1] = (least_song, least_album, least_value)
+        summary['songs_count'][position-1] = songs_count
+        summary['duration_ms'][position-1] = duration_ms
+    summary['albums'] = [album[1:] for album in sorted(summary['albums'])]
+    return summary
+
+
+# Recomputes the user's listening rollups and the play side of the genre and
+# artist rollups for the given (year, month) pairs. Without periods, or the
+# first time the user has any plays, they are rebuilt from all of their plays.
+def refresh_play_analytics(user_id, periods=None):
+    backend().refresh_play_analytics(user_id, periods)
+    cache.invalidate(*[_cache_name(table, user_id) for table in ('analytics_listening', 'analytics_genres', 'analytics_artists')])
+
+
+# Years with liked or played tracks in the genre, artist and listening rollups
+@cache.cached('analytics_artists:{}')
+def get_insight_years(user_id):
+    return [row[0] for row in backend().fetch('get_insight_years', {'user_id': user_id})]
+
+
+# (month, genre, songs, duration_ms) for source 'liked' or 'played', busiest genre first
+@cache.cached('analytics_genres:{}')
+def get_genre_share(user_id, source, year):
+    return backend().fetch('get_genre_share', {'user_id': user_id, 'source': source, 'year': int(year)})
+
+
+# (artist, songs, duration_ms, followers, popularity) of the year's most liked or played artists
+@cache.cached('analytics_artists:{}', 'artists')
+def get_top_artists(user_id, source, year, limit=10):
+    return backend().fetch('get_top_artists', {'user_id': user_id, 'source': source, 'year': int(year), 'limit': limit})
+
+
+# (month, hour, plays, duration_ms) of the year's plays
+@cache.cached('analytics_listening:{}')
+def get_listening(user_id, year):
+    return backend().fetch('get_listening', {'user_id': user_id, 'year': int(year)})
+
+
+# Search
+
+# How close a word has to be to a stored one to be taken as a typo of it, as
+# a share of the word's trigrams found in it; each unknown word of a search
+# is replaced by at most SEARCH_CORRECTIONS stored words
+SEARCH_SIMILARITY = float(os.getenv('SEARCH_SIMILARITY', '0.5'))
+SEARCH_CORRECTIONS = 3
+
+
+# Lowercased words of a name or search, as the 'simple' text search parser splits them
+def _search_terms(text):
+    return [term.lower() for term in re.findall(r'[^\W_]+', text or '')]
+
+
+# Adds the words of the names of the user's tracks liked or played in the
+# given (year, month) pairs, and of their albums and artists, to the words the
+# user's typos are corrected against. Without periods the words are rebuilt
+# from all of their liked and played tracks.
+def refresh_search_words(user_id, periods=None):
+    backend().refresh_search_words(user_id, periods)
+    cache.invalidate(_cache_name('search_words', user_id))
+
+
+# Liked or played tracks whose name, album or artists have a word starting with
+# each word of `query`, as rows shaped like select_liked_songs_page with
+# added_at None for tracks that were only played. Matches on the track's own
+# name come first, then on its album, then on its artists.
+@cache.cached('liked_tracks:{}', 'recent_plays:{}', 'tracks', 'track_artists', 'artists', 'albums', 'search_words:{}')
+def search_library(user_id, query, limit=50):
+    terms = _search_terms(query)
+    if not terms:
+        return []
+    return backend().match_library(user_id, terms, limit)
+
+
+metrics.instrument(globals(), 'storage', exclude=('backend', 'load_statements'))
@@ -0,0 +1,342 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# The functions that talk to Spotify import the client themselves: spotipy and
+# its dependencies are only loaded once a sync runs, not when the web app starts
+import storage
+
+logger = logging.getLogger(__name__)
+
+# Syncs run on a small worker pool so they never hold up a Dash request
+WORKERS = int(os.getenv('SYNC_WORKERS', '2'))
+# Seconds between scheduled syncs of a user who has logged in
+SYNC_INTERVAL = float(os.getenv('SYNC_INTERVAL', '3600'))
+# Processed rows are written to storage in batches of at most this many
+BATCH_SIZE = int(os.getenv('SYNC_BATCH_SIZE', '1000'))
+# Recently played tracks are collected for every stored user on their own
+# schedule, every RECENTS_INTERVAL seconds. Users without new plays are polled
+# less and less often, down to once every RECENTS_MAX_INTERVAL seconds.
+RECENTS_INTERVAL = float(os.getenv('RECENTS_INTERVAL', '180'))
+RECENTS_MAX_INTERVAL = float(os.getenv('RECENTS_MAX_INTERVAL', '1800'))
+RECENTS_WORKERS = int(os.getenv('RECENTS_WORKERS', '4'))
+# Every process serving the app runs the scheduler from the moment it starts.
+# SYNC_SCHEDULER=0 leaves it to a separate `python -m sync` process instead.
+SCHEDULER = os.getenv('SYNC_SCHEDULER', '1') not in ('0', 'false')
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='sync')
+_recents_executor = ThreadPoolExecutor(max_workers=RECENTS_WORKERS, thread_name_prefix='recents')
+_lock = threading.Lock()
+_status = {}
+_recents = {}
+_scheduler = None
+_tables_created = False
+
+
+# (year, month) pairs covered by a batch of liked songs or plays
+def touched_periods(songs):
+    return {(added_at.year, added_at.month) for added_at in songs['added_at']}
+
+
+# Incremental syncs only page through songs liked since the last sync. Every
+# FULL_SYNC_INTERVAL a full sync walks the whole library again so that songs
+# un-liked on Spotify are removed as well. The time of the last one is stored
+# with the user, so restarts and other processes do not repeat it.
+FULL_SYNC_INTERVAL = timedelta(days=7)
+
+
+# Collects processed columns and hands them to `write` BATCH_SIZE rows at a time
+def batched_writer(write):
+    batch = {}
+
+    def add(columns):
+        for name, values in columns.items():
+            batch.setdefault(name, []).extend(values)
+        if batch and len(next(iter(batch.values()))) >= BATCH_SIZE:
+            flush()
+
+    def flush():
+        if batch and next(iter(batch.values())):
+            write(dict(batch))
+        batch.clear()
+
+    return add, flush
+
+
+# Appends the user's plays newer than the newest one stored, following the
+# API's `after` cursor. Ids of artists and albums they reference and the
+# (year, month) pairs they fall in are added to the given sets. Returns the
+# number of plays written.
+def _collect_plays(token, username, artist_ids, album_ids, periods):
+    import spotify
+    after, flag = storage.check_liked_songs('recents', username)
+    add_plays, flush_plays = batched_writer(lambda songs: storage.add_liked_songs_dict(songs, 'recents', username))
+    count = 0
+    for page in spotify.recent_song_pages(token, after=after, user=username):
+        plays = spotify.track_columns(page, after if flag else None)
+        for artists in plays['artists']:
+            artist_ids.update(artists)
+        album_ids.update(plays['album'])
+        periods |= touched_periods(plays)
+        count += len(plays['song_id'])
+        add_plays(plays)
+    flush_plays()
+    return count
+
+
+# Stores the artists and albums among the given ids that are not stored yet
+def store_metadata(token, artist_ids, album_ids, report=None):
+    import spotify
+    report = report or (lambda stage, fraction: None)
+
+    # Artists processed
+    report('artists', 0.5)
+    # Only ids the database does not know yet are fetched
+    add_artists, flush_artists = batched_writer(storage.add_artists_dict)
+    for artists in spotify.artist_batches(token, storage.select_missing_artists(artist_ids)):
+        add_artists(spotify.artist_columns(artists))
+    flush_artists()
+
+    # Albums processed
+    report('albums', 0.7)
+    add_albums, flush_albums = batched_writer(storage.add_albums_dict)
+    for albums in spotify.album_batches(token, storage.select_missing_albums(album_ids)):
+        add_albums(spotify.album_columns(albums))
+    flush_albums()
+
+
+def collect_recents(username):
+    import spotify
+    token = spotify.spotify_init(username)
+    artist_ids, album_ids, periods = set(), set(), set()
+    count = _collect_plays(token, username, artist_ids, album_ids, periods)
+    store_metadata(token, artist_ids, album_ids)
+    if periods:
+        storage.create_analytics_tables(username)
+        storage.refresh_play_analytics(username, periods)
+        storage.refresh_search_words(username, periods)
+    return count
+
+
+# The sync streams every stage: each page of saved tracks and each batch of
+# albums or artists is processed and written before the next one is used, so
+# only the ids seen so far are kept for the whole library.
+def fetch_data(username, full_sync=None, progress=None):
+    import spotify
+
+    report = progress or (lambda stage, fraction: None)
+
+    report('authorizing', 0.0)
+    token = spotify.spotify_init(username)
+
+    # Liked songs processed
+    report('liked songs', 0.05)
+    storage.add_user(username)
+    storage.claim_unowned_rows(username)
+    res, flag = storage.check_liked_songs('liked_songs', username)
+    if full_sync is None:
+        full_sync = datetime.now() - (storage.select_last_full_sync(username) or datetime.min) > FULL_SYNC_INTERVAL
+
+    song_ids = set()
+    artist_ids_spotify = set()
+    album_ids_spotify = set()
+    periods = set()
+    add_songs, flush_songs = batched_writer(lambda songs: storage.add_liked_songs_dict(songs, 'liked_songs', username))
+
+    for page in spotify.liked_song_pages(token, since=res if flag and not full_sync else None, user=username):
+        if full_sync:
+            song_ids.update(i['track']['id'] for i in page if i['track'] is not None and i['track']['id'] is not None)
+        songs = spotify.track_columns(page, res if flag else None)
+        for artists in songs['artists']:
+            artist_ids_spotify.update(artists)
+        album_ids_spotify.update(songs['album'])
+        periods |= touched_periods(songs)
+        add_songs(songs)
+    flush_songs()
+
+    if full_sync:
+        periods |= storage.delete_unliked_songs(username, song_ids)
+    song_ids = None
+
+    # Recents Processed
+    report('recently played', 0.4)
+    play_periods = set()
+    _collect_plays(token, username, artist_ids_spotify, album_ids_spotify, play_periods)
+
+    store_metadata(token, artist_ids_spotify, album_ids_spotify, report)
+
+    # Analytics refreshed only for the months that gained songs
+    report('analytics', 0.9)
+    if storage.create_analytics_tables(username):
+        storage.refresh_analytics(username)
+    elif periods:
+        storage.refresh_analytics(username, periods)
+    if play_periods:
+        storage.refresh_play_analytics(username, play_periods)
+    # Words of removed songs only leave the search vocabulary on full syncs
+    if full_sync:
+        storage.refresh_search_words(username)
+    elif periods or play_periods:
+        storage.refresh_search_words(username, periods | play_periods)
+
+    if full_sync:
+        storage.record_full_sync(username, datetime.now())
+
+
+# Statuses are stored as well, so the tools page can poll any worker process
+def _update(username, **changes):
+    with _lock:
+        _status[username].update(changes)
+        status = dict(_status[username])
+    storage.save_sync_status(username, status)
+
+
+# Only the process holding the user's sync lock writes the stored status; the
+# others record their outcome in this process alone
+def _update_local(username, **changes):
+    with _lock:
+        _status[username].update(changes, finished_at=datetime.now())
+
+
+def _run(username, full_sync):
+    try:
+        # Guards against the same user syncing in another worker process
+        with storage.advisory_lock('sync:' + username) as acquired:
+            if not acquired:
+                _update_local(username, state='skipped', error='a sync for this user is already running elsewhere')
+                return
+            try:
+                _update(username, state='running', started_at=datetime.now())
+                fetch_data(username, full_sync=full_sync,
+                           progress=lambda stage, fraction: _update(username, stage=stage, progress=fraction))
+                _update(username, state='done', stage=None, progress=1.0, finished_at=datetime.now())
+            except Exception as error:
+                logger.exception('sync for %s failed', username)
+                _update(username, state='failed', finished_at=datetime.now(), error=str(error))
+    except Exception as error:
+        # The lock could not be taken, or the failure could not be stored
+        logger.exception('sync for %s failed', username)
+        _update_local(username, state='failed', error=str(error))
+
+
+# The schema statements lock the tables they touch, so while another process's
+# sync writes to them they would wait on it or deadlock with it. They run once
+# per process as it starts, never on the sync or login path.
+def _create_tables():
+    global _tables_created
+    if not _tables_created:
+        storage.create_tables()
+        _tables_created = True
+
+
+# Prepares the process to run syncs and starts the scheduler; called once by
+# whatever serves the app
+def start():
+    _create_tables()
+    if SCHEDULER:
+        start_scheduler()
+
+
+# Queues a sync for the user unless one is already queued or running, here
+# or in another process. Returns whether a new sync was queued.
+def request_sync(username, full_sync=None):
+    with storage.advisory_lock('sync:' + username) as acquired:
+        if not acquired:
+            return False
+    with _lock:
+        status = _status.get(username)
+        if status is not None and status['state'] in ('queued', 'running'):
+            return False
+        _status[username] = {
+            'state': 'queued',
+            'stage': None,
+            'progress': 0.0,
+            'queued_at': datetime.now(),
+            'started_at': None,
+            'finished_at': None,
+            'error': None,
+        }
+        status = dict(_status[username])
+    storage.save_sync_status(username, status)
+    _executor.submit(_run, username, full_sync)
+    return True
+
+
+def sync_status(username):
+    return storage.select_sync_status(username)
+
+
+def _collect(username):
+    count = None
+    try:
+        # Another worker polling the same users may be collecting this one
+        with storage.advisory_lock('recents:' + username) as acquired:
+            if acquired:
+                count = collect_recents(username)
+    except Exception:
+        logger.exception('collecting recent plays for %s failed', username)
+        count = 0
+    with _lock:
+        state = _recents[username]
+        # A skipped collection keeps its interval and is tried again when due
+        if count is not None:
+            state['interval'] = RECENTS_INTERVAL if count else min(state['interval'] * 2, RECENTS_MAX_INTERVAL)
+        state['due'] = time.monotonic() + state['interval']
+        state['running'] = False
+
+
+# Queues a recents collection for every stored user that is due and not
+# already being collected or synced
+def poll_recents():
+    users = storage.select_users()
+    now = time.monotonic()
+    due = []
+    with _lock:
+        for username in users:
+            state = _recents.setdefault(username, {'due': now, 'interval': RECENTS_INTERVAL, 'running': False})
+            syncing = _status.get(username, {}).get('state') in ('queued', 'running')
+            if state['due'] <= now and not state['running'] and not syncing:
+                state['running'] = True
+                due.append(username)
+    for username in due:
+        _recents_executor.submit(_collect, username)
+    return due
+
+
+def _schedule_loop():
+    while True:
+        time.sleep(min(SYNC_INTERVAL, RECENTS_INTERVAL, 60))
+        with _lock:
+            due = [username for username, status in _status.items()
+                   if status['finished_at'] is not None
+                   and (datetime.now() - status['finished_at']).total_seconds() >= SYNC_INTERVAL]
+        for username in due:
+            request_sync(username)
+        try:
+            poll_recents()
+        except Exception:
+            logger.exception('polling recent plays failed')
+
+
+# Re-syncs every user seen by request_sync once SYNC_INTERVAL has passed
+# since their last sync finished, and collects recent plays for every stored
+# user as described above. Each worker process runs one; the per-user
+# advisory locks keep two of them from syncing or collecting the same user.
+def start_scheduler():
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=_schedule_loop, name='sync-scheduler', daemon=True)
+            _scheduler.start()
+
+
+# Runs the scheduler without the web app, e.g. as a separate collector process
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    _create_tables()
+    start_scheduler()
+    while True:
+        time.sleep(3600)